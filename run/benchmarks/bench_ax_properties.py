@@ -0,0 +1,53 @@
+import matplotlib
+matplotlib.use("Agg")
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from sky.plotlib import LinePlot, apply_ax_properties, merge_ax_properties
+
+# Drawing and styling of a 100-subplot figure with k overlaid LinePlots per subplot:
+# per item styling (plot_item.plot, the axis settings are applied k times) against the batched
+# styling of Plotter.plot (draw all items, apply the merged settings once).
+
+n_subplots = 100
+x = np.linspace(0, 1, 100)
+
+def create_subplots(k):
+    subplots = []
+    for i in range(n_subplots):
+        items = []
+        for j in range(k):
+            item = LinePlot(x, np.sin(2 * np.pi * (j + 1) * x))
+            item.set_frame_prop(5, rm_top = True, rm_right = True)
+            item.draw_yticklabels = i % 10 == 0
+            items.append(item)
+        subplots.append(items)
+    return subplots
+
+def per_item(ax, items):
+    for item in items:
+        item.plot(ax)
+
+def batched(ax, items):
+    for item in items:
+        item.draw(ax)
+    apply_ax_properties(ax, merge_ax_properties(items))
+
+def measure(style, k, repeat = 3):
+    times = []
+    for _ in range(repeat):
+        subplots = create_subplots(k)
+        fig, axes = plt.subplots(10, n_subplots // 10, figsize = (20, 20))
+        t_start = time.perf_counter()
+        for ax, items in zip(axes.flatten(), subplots):
+            style(ax, items)
+        times.append(time.perf_counter() - t_start)
+        plt.close(fig)
+    return min(times)
+
+if __name__ == "__main__":
+    for k in [1, 3, 10]:
+        t_per_item = measure(per_item, k)
+        t_batched = measure(batched, k)
+        print(f"{n_subplots} subplots x {k:2d} items: per item {t_per_item:6.3f} s, batched {t_batched:6.3f} s, "
+              f"speedup {t_per_item / t_batched:4.1f}x")
@@ -0,0 +1,59 @@
+import matplotlib
+matplotlib.use("Agg")
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+import sky.plotlib as plotlib
+from sky.plotlib import LinePlot
+
+# Per-axes styling cost of Axes2D.set_2D_ax_properties with the native despine compared to seaborn.despine.
+# The rendered figures of both variants are compared pixel by pixel.
+
+n_axes = 100
+frame_settings = [dict(offset = 0),
+                  dict(offset = 5, rm_top = True, rm_right = True),
+                  dict(offset = 10, rm_left = True, rm_bottom = True),
+                  dict(offset = 3, rm_top = True, rm_bottom = True, rm_left = True)]
+
+def seaborn_despine(ax, offset = None, top = True, right = True, left = False, bottom = False):
+    import seaborn as sns
+    sns.despine(ax = ax, offset = offset, top = top, right = right, left = left, bottom = bottom)
+    return ax
+
+def render(despine, frame_setting):
+    plotlib.despine = despine
+    fig, axes = plt.subplots(10, n_axes // 10, figsize = (20, 20))
+    x = np.linspace(0, 1, 50)
+    plots = []
+    for ax in axes.flatten():
+        line = LinePlot(x, np.sin(2 * np.pi * x))
+        line.set_frame_prop(**frame_setting)
+        ax.plot(line.x, line.y)
+        plots.append((line, ax))
+
+    t_start = time.perf_counter()
+    for line, ax in plots:
+        line.set_2D_ax_properties(ax)
+    t_style = time.perf_counter() - t_start
+
+    fig.canvas.draw()
+    image = np.asarray(fig.canvas.buffer_rgba()).copy()
+    plt.close(fig)
+    return t_style, image
+
+if __name__ == "__main__":
+    native_despine = plotlib.despine
+    try:
+        import seaborn
+    except ImportError:
+        seaborn = None
+
+    for frame_setting in frame_settings:
+        t_native, image_native = render(native_despine, frame_setting)
+        line = f"{str(frame_setting):70s} native {t_native / n_axes * 1000:6.3f} ms/axes"
+        if seaborn is not None:
+            t_seaborn, image_seaborn = render(seaborn_despine, frame_setting)
+            line = line + f", seaborn {t_seaborn / n_axes * 1000:6.3f} ms/axes, identical: {np.array_equal(image_native, image_seaborn)}"
+        print(line)
+
+    plotlib.despine = native_despine
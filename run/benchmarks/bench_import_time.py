@@ -0,0 +1,53 @@
+import sys
+import json
+import argparse
+import subprocess
+
+# Import time guard: every module is imported in a fresh interpreter. The script fails if an import
+# takes longer than its budget or pulls in one of the heavy dependencies that should be loaded lazily.
+
+heavy_modules = ["matplotlib", "matplotlib.pyplot", "seaborn", "pandas", "scipy", "vtk"]
+
+# module: (budget in s, heavy modules that are allowed)
+cases = {"sky":                        (0.5, []),
+         "sky.config":                 (0.5, []),
+         "sky.datastructures":         (0.5, []),
+         "sky.filemanager":            (0.5, []),
+         "sky.instrument":             (0.5, []),
+         "sky.regenerate":             (0.5, []),
+         "sky.sweep":                  (0.5, []),
+         "sky.demo_model.analytic":    (0.5, []),
+         "sky.plotlib":                (0.5, []),
+         "sky.pdftex_export":          (0.5, [])}
+
+probe = """
+import sys, time, json
+t_start = time.perf_counter()
+import {module}
+t_import = time.perf_counter() - t_start
+print(json.dumps({{"time": t_import, "modules": [m for m in {heavy} if m in sys.modules]}}))
+"""
+
+def measure_import(module, repeat = 3):
+    results = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", probe.format(module = module, heavy = heavy_modules)])
+        results.append(json.loads(output))
+    return min(result["time"] for result in results), results[0]["modules"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', default = 1.0, type = float, help = 'factor applied to all time budgets')
+    args = parser.parse_args()
+
+    failed = False
+    for module, (budget, allowed) in cases.items():
+        t_import, loaded = measure_import(module)
+        unexpected = [m for m in loaded if m not in allowed]
+        ok = t_import <= budget * args.scale and not unexpected
+        failed = failed or not ok
+        status = "ok  " if ok else "FAIL"
+        print(f"{status} {module:28s} {t_import * 1000:8.1f} ms (budget {budget * args.scale * 1000:.0f} ms)"
+              + (f", loaded {', '.join(unexpected)}" if unexpected else ""))
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,31 @@
+import matplotlib
+matplotlib.use("Agg")
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from sky.plotlib import LinePlot, Plotter
+
+# Figure creation (Plotter.plot) and rendering time of figures with many subplots for the tight and the
+# constrained layout, with and without shared axes.
+
+x = np.linspace(0, 1, 50)
+
+def measure(n_subplots, layout, share):
+    plots = [LinePlot(x, np.sin(2 * np.pi * (i + 1) * x)) for i in range(n_subplots)]
+    t_start = time.perf_counter()
+    fig, ax = Plotter(open_saved_plot = False).plot(*plots, plt_show = False, sharex = share, sharey = share,
+                                                    layout = layout)
+    t_create = time.perf_counter() - t_start
+    t_start = time.perf_counter()
+    fig.canvas.draw()
+    t_draw = time.perf_counter() - t_start
+    plt.close(fig)
+    return t_create, t_draw
+
+if __name__ == "__main__":
+    for n_subplots in [16, 64, 200]:
+        for layout in ["tight", "constrained"]:
+            for share in [False, True]:
+                t_create, t_draw = measure(n_subplots, layout, share)
+                print(f"{n_subplots:4d} subplots, {layout:11s} shared axes {str(share):5s}: "
+                      f"create {t_create:7.3f} s, draw {t_draw:7.3f} s")
@@ -0,0 +1,99 @@
+from sky.pdftex_export import transform_pdf_tex, check_translation_rules
+import os
+import time
+import tempfile
+import tracemalloc
+import numpy as np
+
+# Benchmark of the pdf_tex post-processing on a synthetic Inkscape output with 100k lines.
+# The in-memory implementation that latex_graphic_export used before is kept here as reference.
+
+n_lines = 100_000
+graphic_name = "BenchFigure"
+
+def write_synthetic_pdf_tex(file_path, n_lines):
+    rng = np.random.default_rng(0)
+    with open(file_path, "w") as f:
+        for i in range(26):
+            f.write(f"%% Inkscape hint line {i}\n")
+        f.write("\\begingroup%\n")
+        f.write("  \\begin{picture}(1,0.61803399)%\n")
+        f.write("    \\lineheight{1}%\n")
+        f.write("    \\setlength\\tabcolsep{0pt}%\n")
+        f.write(f"    \\put(0,0){{\\includegraphics[width=\\unitlength,page=1]{{{graphic_name}.pdf}}}}%\n")
+        for i in range(n_lines - 36):
+            x, y = rng.random(2)
+            if i % 3 == 0:
+                text = "f in Hz"
+            else:
+                text = f"{rng.random() * 10 ** rng.integers(0, 4):.{rng.integers(0, 3)}f}"
+            f.write(f"    \\put({x:.8f},{y:.8f}){{\\makebox(0,0)[lt]{{\\lineheight{{1.25}}"
+                    f"\\smash{{\\begin{{tabular}}[t]{{l}}{text}\\end{{tabular}}}}}}}}%\n")
+        f.write("  \\end{picture}%\n")
+        f.write("\\endgroup%\n")
+
+def legacy_transform(source, target, pdf_tex_dir = r'./pics/'):
+    import re
+    file = open(source, 'r')
+    contents = file.readlines()
+    file.close()
+
+    contents = contents[26:]
+    pdf_including = []
+    tex_including = []
+    num_including = []
+    idx_including = []
+    for ii, content in enumerate(contents):
+        check = re.search(r'put', content)
+        if check is not None:
+            check = re.search(fr'{graphic_name}.pdf', content)
+            if check is not None:
+                value = check.string[0:check.start()] + f'{pdf_tex_dir}{graphic_name}.pdf' + check.string[check.end():]
+                pdf_including.append(value)
+                contents[ii] = value
+            else:
+                start = content.index('{l}') + 3
+                stop = content.index(r'\end')
+                if content[start:stop].replace(".", "", 1).isdigit():
+                    num_including.append(content)
+                else:
+                    content = check_translation_rules(string=content, start=start, stop=stop, use_si=True)
+                    tex_including.append(content)
+            idx_including.append(ii)
+
+    for idx, content in zip(idx_including,
+                            pdf_including + sorted(num_including, key=len) + sorted(tex_including, key=len)):
+        contents[idx] = content
+
+    file = open(target, 'w')
+    file.write("".join(contents))
+    file.close()
+
+def measure(fun, *args, **kwargs):
+    # Time and memory are measured in separate runs, tracemalloc slows down every allocation
+    t_start = time.perf_counter()
+    fun(*args, **kwargs)
+    t_wall = time.perf_counter() - t_start
+
+    tracemalloc.start()
+    fun(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return t_wall, peak
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, graphic_name + ".pdf_tex")
+        write_synthetic_pdf_tex(source, n_lines)
+
+        t_legacy, mem_legacy = measure(legacy_transform, source, os.path.join(tmp_dir, "legacy.tex"))
+        t_stream, mem_stream = measure(transform_pdf_tex, source, os.path.join(tmp_dir, "stream.tex"),
+                                       graphic_name = graphic_name, use_replacing_rules = True, use_si_pack = True)
+
+        with open(os.path.join(tmp_dir, "legacy.tex")) as f_legacy, open(os.path.join(tmp_dir, "stream.tex")) as f_stream:
+            identical = f_legacy.read() == f_stream.read()
+
+    print(f"pdf_tex lines: {n_lines}")
+    print(f"legacy    : {t_legacy:8.3f} s, peak memory {mem_legacy / 2**20:8.2f} MiB")
+    print(f"streaming : {t_stream:8.3f} s, peak memory {mem_stream / 2**20:8.2f} MiB")
+    print(f"identical output: {identical}")
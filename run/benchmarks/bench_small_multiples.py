@@ -0,0 +1,33 @@
+import matplotlib
+matplotlib.use("Agg")
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from sky.datastructures import Grid, GridData
+from sky.plotlib import Plotter, create_scalar_para_plots, create_small_multiples
+
+# Rendering of n line samples of a parameter sweep in one subplot: one LinePlot per sample
+# (create_scalar_para_plots) against one LineCollection (create_small_multiples).
+
+x = np.linspace(0, 1, 200)
+
+def create_data(n_samples):
+    para_grid = Grid(np.linspace(1, 2, n_samples // 10), np.linspace(1, 3, 10), labels = ["amp", "freq"])
+    amp = para_grid.nodes[:, 0][None, :]
+    freq = para_grid.nodes[:, 1][None, :]
+    return para_grid, GridData(Grid(x), amp * np.sin(2 * np.pi * freq * x[:, None]))
+
+def render(plots):
+    t_start = time.perf_counter()
+    fig, ax = Plotter(open_saved_plot = False).plot(*plots, plt_show = False)
+    fig.canvas.draw()
+    plt.close(fig)
+    return time.perf_counter() - t_start
+
+if __name__ == "__main__":
+    for n_samples in [50, 200, 500]:
+        para_grid, data = create_data(n_samples)
+        t_loop = render([create_scalar_para_plots(para_grid, data, sample = list(range(n_samples)))])
+        t_collection = render(create_small_multiples(data, para_grid = para_grid))
+        print(f"{n_samples:4d} samples: one LinePlot per sample {t_loop:6.3f} s, LineCollection {t_collection:6.3f} s, "
+              f"speedup {t_loop / t_collection:5.1f}x")
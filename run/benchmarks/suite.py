@@ -0,0 +1,269 @@
+import matplotlib
+matplotlib.use("Agg")
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from datetime import date, datetime, timedelta
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.tri
+
+from sky.datastructures import Grid, GridData, StreamingHistogram, TriMesh
+from sky.filemanager import remove_folders
+from sky.pdftex_export import check_translation_rules, create_translation_lookup, split_put_text, transform_pdf_tex
+import sky.pdftex_export as pdftex_export
+import sky.plotlib as plotlib
+from bench_pdftex_export import write_synthetic_pdf_tex
+
+# Benchmark suite for the hot paths of sky. Every case is timed over several repeats (the setup of a case
+# is not timed) and its peak memory is measured with tracemalloc in a separate run. The results are
+# compared against a stored baseline; the script fails if a case got slower or needs more memory than
+# the tolerance allows.
+#
+#   python suite.py --save                     # run all cases and store them as the baseline
+#   python suite.py                            # compare against the baseline
+#   python suite.py --filter "grid|plotter_LinePlot" --quick
+
+cases = {}
+
+def benchmark(name, repeat = 5, setup = None, teardown = None, large = False):
+    'Registers fun(*setup()) as benchmark case, setup and teardown are called around every run'
+    def register(fun):
+        cases[name] = dict(fun = fun, repeat = repeat, setup = setup, teardown = teardown, large = large)
+        return fun
+    return register
+
+def run_case(case):
+    times = []
+    for _ in range(case["repeat"]):
+        args = case["setup"]() if case["setup"] is not None else ()
+        t_start = time.perf_counter()
+        case["fun"](*args)
+        times.append(time.perf_counter() - t_start)
+        if case["teardown"] is not None:
+            case["teardown"](*args)
+
+    # Memory in a separate run, tracemalloc slows down every allocation
+    args = case["setup"]() if case["setup"] is not None else ()
+    tracemalloc.start()
+    case["fun"](*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if case["teardown"] is not None:
+        case["teardown"](*args)
+
+    return {"time": min(times), "median": float(np.median(times)), "peak_memory": peak}
+
+# ======================================== Grid / GridData ========================================
+
+def square_grid(n_nodes):
+    n = int(round(np.sqrt(n_nodes)))
+    return Grid(np.linspace(0, 1, n), np.linspace(0, 2, n))
+
+for n_nodes, repeat in [(10**3, 20), (10**5, 10), (10**7, 2)]:
+    benchmark(f"grid_construction_{n_nodes:.0e}", repeat = repeat, large = n_nodes >= 10**7)(
+        lambda n_nodes = n_nodes: square_grid(n_nodes))
+
+@benchmark("grid_nodes_in_square", setup = lambda: (square_grid(300**2),))
+def grid_nodes_in_square(grid):
+    for node_id in range(0, grid.size, grid.size // 100):
+        grid.get_nodes_in_square(node_id, 0.1)
+
+@benchmark("grid_euclid_distance", setup = lambda: (square_grid(300**2),))
+def grid_euclid_distance(grid):
+    grid.get_euclid_distance(np.arange(grid.size // 3, grid.size // 3 + 50), 0.1)
+
+def create_grid_data():
+    grid = square_grid(200**2)
+    return (GridData(grid, np.random.default_rng(0).random((grid.size, 200))),)
+
+@benchmark("griddata_shaped_data", setup = create_grid_data)
+def griddata_shaped_data(data):
+    data.get_shaped_data()
+
+@benchmark("grid_interpolator_1d", setup = lambda: (Grid(np.linspace(0, 1, 10**5)),))
+def grid_interpolator_1d(grid):
+    grid.create_interpolator(np.sin(grid.nodes[:, 0]))
+
+@benchmark("grid_interpolator_2d", setup = lambda: (square_grid(500**2),))
+def grid_interpolator_2d(grid):
+    grid.create_interpolator(np.sin(grid.nodes[:, 0]) * grid.nodes[:, 1])
+
+@benchmark("streaming_histogram_1e7", repeat = 3, setup = lambda: (np.random.default_rng(0).normal(size = 10**7),),
+           large = True)
+def streaming_histogram(values):
+    StreamingHistogram.from_data(values, bins = 100)
+
+# ======================================== Plotter.plot ========================================
+
+def create_plot_items():
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 1, 1000)
+    grid = Grid(np.linspace(0, 1, 100), np.linspace(0, 2, 80))
+    x_tri, y_tri = rng.random(2000), rng.random(2000)
+    mesh = TriMesh(x_tri, y_tri, matplotlib.tri.Triangulation(x_tri, y_tri).triangles)
+    x_vec, y_vec = np.meshgrid(np.linspace(0, 1, 30), np.linspace(0, 1, 30))
+
+    return {"LinePlot": lambda: plotlib.LinePlot(x, np.sin(2 * np.pi * x)),
+            "LineCollectionPlot": lambda: plotlib.LineCollectionPlot(x, np.sin(np.outer(x, np.arange(1, 101)))),
+            "HistPlot": lambda: plotlib.HistPlot(rng.normal(size = 10**5)),
+            "HistPlot_streaming": lambda: plotlib.HistPlot(StreamingHistogram.from_data(rng.normal(size = 10**5))),
+            "BarPlot": lambda: plotlib.BarPlot(rng.random(50)),
+            "ContourPlot": lambda: plotlib.ContourPlot(grid, np.sin(5 * grid.nodes[:, 0]) * grid.nodes[:, 1]),
+            "TriContourPlot": lambda: plotlib.TriContourPlot.from_mesh(mesh, np.sin(5 * x_tri) * y_tri),
+            "ImagePlot": lambda: plotlib.ImagePlot(rng.random((500, 500))),
+            "ImagePlot_pooled": lambda: plotlib.ImagePlot(rng.integers(0, 256, (8000, 8000), dtype = np.uint8)),
+            "ScatterPlot": lambda: plotlib.ScatterPlot(rng.random(5000), rng.random(5000)),
+            "ScatterGridPlot": lambda: plotlib.ScatterGridPlot(grid, grid.nodes[:, 0] * 50),
+            "PolygonPlot": lambda: plotlib.PolygonPlot(rng.random((50, 2))),
+            "RectanglePlot": lambda: plotlib.RectanglePlot((0.2, 0.3), 0.5, 0.4),
+            "RectangleCollectionPlot": lambda: plotlib.RectangleCollectionPlot(rng.random(10**4), rng.random(10**4), 0.01,
+                                                                               0.01, values = rng.random(10**4)),
+            "PolygonCollectionPlot": lambda: plotlib.PolygonCollectionPlot.from_mesh(mesh, rng.random(mesh.get_triangulation().triangles.shape[0])),
+            "vectorFieldPlot": lambda: plotlib.vectorFieldPlot(x_vec, y_vec, -y_vec, x_vec)}
+
+plot_items = create_plot_items()
+
+def create_plot_folder():
+    return (tempfile.mkdtemp(prefix = "sky_bench_"),)
+
+def remove_plot_folder(folder):
+    plt.close("all")
+    shutil.rmtree(folder, ignore_errors = True)
+
+for plot_name, create_item in plot_items.items():
+    for save_format in ["pdf", "png"]:
+        def plot_and_save(folder, create_item = create_item, save_format = save_format):
+            plotter = plotlib.Plotter(save_path = folder, save_format = save_format, save_plot_data = False,
+                                      open_saved_plot = False)
+            plotter.plot(create_item(), plt_show = False)
+        benchmark(f"plotter_{plot_name}_{save_format}", repeat = 3, setup = create_plot_folder,
+                  teardown = remove_plot_folder)(plot_and_save)
+
+# ======================================== pdf_tex export ========================================
+
+def create_pdf_tex(n_lines = 20_000):
+    folder = tempfile.mkdtemp(prefix = "sky_bench_")
+    source = os.path.join(folder, "BenchFigure.pdf_tex")
+    write_synthetic_pdf_tex(source, n_lines)
+    return folder, source
+
+def read_put_texts():
+    folder, source = create_pdf_tex()
+    with open(source) as file:
+        lines = [(line,) + split_put_text(line) for line in file if "\\put(" in line and split_put_text(line) is not None]
+    shutil.rmtree(folder)
+    return (lines,)
+
+@benchmark("pdftex_check_translation_rules", setup = read_put_texts)
+def pdftex_check_translation_rules(lines):
+    lookup = create_translation_lookup(pdftex_export.translation_rules)
+    for line, start, stop in lines:
+        check_translation_rules(string = line, start = start, stop = stop, use_si = True, lookup = lookup)
+
+@benchmark("pdftex_transform_pdf_tex", setup = create_pdf_tex, teardown = lambda folder, source: shutil.rmtree(folder))
+def pdftex_transform(folder, source):
+    transform_pdf_tex(source, os.path.join(folder, "BenchFigure.tex"), graphic_name = "BenchFigure",
+                      use_replacing_rules = True, use_si_pack = True)
+
+# ======================================== Result folders ========================================
+
+def create_result_tree(n_folders = 10_000):
+    folder = tempfile.mkdtemp(prefix = "sky_bench_")
+    start = date(1990, 1, 1)
+    for i in range(n_folders):
+        os.mkdir(os.path.join(folder, (start + timedelta(days = i)).strftime('%Y-%m-%d')))
+    return (folder,)
+
+def create_indexed_result_tree():
+    folder, = create_result_tree()
+    # The first call scans the folders and writes the manifest
+    remove_folders(folder, 10**6, '%Y-%m-%d')
+    return (folder,)
+
+def remove_result_tree(folder):
+    # Wait for the background deletion before removing the tree
+    for thread in threading.enumerate():
+        if thread.name == "sky-trash-purge":
+            thread.join()
+    shutil.rmtree(folder, ignore_errors = True)
+
+@benchmark("remove_folders_10k_prune", repeat = 3, setup = create_result_tree, teardown = remove_result_tree)
+def remove_folders_prune(folder):
+    remove_folders(folder, 10, '%Y-%m-%d')
+
+@benchmark("remove_folders_10k_manifest", repeat = 3, setup = create_indexed_result_tree, teardown = remove_result_tree)
+def remove_folders_manifest(folder):
+    remove_folders(folder, 10**6, '%Y-%m-%d')
+
+# ======================================== Baseline ========================================
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("cases", {}).get(name)
+        if reference is None:
+            print(f"     {name:45s} {result['time'] * 1000:10.2f} ms {result['peak_memory'] / 2**20:9.2f} MiB  (no baseline)")
+            continue
+
+        time_ratio = result["time"] / reference["time"] if reference["time"] > 0 else 1.0
+        memory_ratio = result["peak_memory"] / reference["peak_memory"] if reference["peak_memory"] > 0 else 1.0
+        failed = time_ratio > 1 + time_tolerance or memory_ratio > 1 + memory_tolerance
+        if failed:
+            regressions.append(name)
+        status = "FAIL" if failed else "ok  "
+        print(f"{status} {name:45s} {result['time'] * 1000:10.2f} ms ({time_ratio:5.2f}x) "
+              f"{result['peak_memory'] / 2**20:9.2f} MiB ({memory_ratio:5.2f}x)")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--baseline', default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json"),
+                        help = 'baseline file (json)')
+    parser.add_argument('--save', action = 'store_true', help = 'store the results as new baseline')
+    parser.add_argument('--filter', default = None, help = 'only run the cases matching this regex')
+    parser.add_argument('--quick', action = 'store_true', help = 'skip the large cases')
+    parser.add_argument('--time-tolerance', default = 0.25, type = float, help = 'allowed relative slowdown')
+    parser.add_argument('--memory-tolerance', default = 0.10, type = float, help = 'allowed relative increase of the peak memory')
+    args = parser.parse_args()
+
+    selected = {name: case for name, case in cases.items()
+                if (args.filter is None or re.search(args.filter, name)) and not (args.quick and case["large"])}
+
+    results = {}
+    for name, case in selected.items():
+        results[name] = run_case(case)
+        if args.save or not os.path.exists(args.baseline):
+            print(f"     {name:45s} {results[name]['time'] * 1000:10.2f} ms {results[name]['peak_memory'] / 2**20:9.2f} MiB")
+
+    if args.save:
+        baseline = {"cases": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        baseline["cases"].update(results)
+        baseline["machine"] = {"python": sys.version.split()[0], "platform": platform.platform(),
+                               "processor": platform.processor(), "date": datetime.now().isoformat(timespec = "seconds")}
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent = 2)
+        print(f'Saved {len(results)} cases to "{args.baseline}"')
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline "{args.baseline}", create one with --save')
+        sys.exit(0)
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+    sys.exit(1 if regressions else 0)
@@ -3,6 +3,7 @@ from sky.demo_model.logger import init_logger
 from sky.demo_model.argparser import get_config_demo_model
 from sky.demo_model.analytic import analytic_model_1d
 import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -19,7 +20,7 @@ result_folder = save_script(os.path.realpath(__file__), tag, max_daily_folders =
 logger = init_logger(result_folder, "logfile")
 
 # Get user input from: cmd line > config file > defaults
-config = get_config_demo_model("run\\public\\user_input_files\\sim_para.yaml", result_folder, logger)
+config = get_config_demo_model("run\\public\\user_input_files\\sim_para.yaml", result_folder, logger, args = sys.argv[1:])
 print(config)
 
 # -------------------
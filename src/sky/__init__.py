@@ -0,0 +1,14 @@
+import importlib
+
+# Submodules are imported on first access (sky.plotlib, sky.datastructures, ...), so importing sky
+# does not pull in matplotlib or scipy.
+submodules = ["config", "datastructures", "demo_model", "filemanager", "instrument", "lazyimport", "pdftex_export",
+              "plotlib", "regenerate", "runindex", "sweep"]
+
+def __getattr__(name):
+    if name in submodules:
+        return importlib.import_module("sky." + name)
+    raise AttributeError(f"module 'sky' has no attribute '{name}'")
+
+def __dir__():
+    return sorted(list(globals()) + submodules)
@@ -0,0 +1,193 @@
+import os
+import argparse
+import numpy as np
+from sky.datastructures import Grid
+
+# YAML files parsed so far: absolute path -> (mtime, size, values)
+yaml_cache = {}
+
+class Param:
+    'One config parameter: name, type (float, int, str or bool), default and help text'
+    def __init__(self, name, type = float, default = None, help = ""):
+        self.name = name
+        self.type = type
+        self.default = default
+        self.help = help
+
+    def cast(self, value):
+        'Converts one value to the parameter type, lists become tuples of converted values'
+        if isinstance(value, (list, tuple)):
+            return tuple(self.cast(item) for item in value)
+        if value is None:
+            return None
+
+        if self.type is bool:
+            if isinstance(value, str):
+                if value.lower() not in ["true", "false", "1", "0", "yes", "no"]:
+                    raise ValueError(f'Parameter "{self.name}": "{value}" is not a bool')
+                return value.lower() in ["true", "1", "yes"]
+            return bool(value)
+
+        if self.type is int:
+            number = float(value)
+            if not number.is_integer():
+                raise ValueError(f'Parameter "{self.name}": {value} is not an integer')
+            return int(number)
+
+        try:
+            return self.type(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Parameter "{self.name}": {value!r} is not of type {self.type.__name__}')
+
+class FrozenConfig:
+    """ Immutable, hashable set of config values
+
+    Values are read as attributes (config.amp) like an argparse Namespace. List values of the YAML
+    file are stored as tuples and mark sweep parameters: grid() returns the Grid over all of them,
+    expand() one FrozenConfig per grid node and base() the config with the first value of each.
+    """
+    __slots__ = ("values", "hash")
+
+    def __init__(self, values):
+        object.__setattr__(self, "values", dict(sorted(values.items())))
+        object.__setattr__(self, "hash", hash(tuple(self.values.items())))
+
+    def __getattr__(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            raise AttributeError(f"Config has no parameter '{name}'")
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FrozenConfig is immutable, use replace(...)")
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def __contains__(self, name):
+        return name in self.values
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return isinstance(other, FrozenConfig) and self.values == other.values
+
+    def __repr__(self):
+        return "FrozenConfig(" + ", ".join(f"{name}={value!r}" for name, value in self.values.items()) + ")"
+
+    def __reduce__(self):
+        return (FrozenConfig, (self.values,))
+
+    def to_dict(self):
+        return dict(self.values)
+
+    def replace(self, **changes):
+        values = self.to_dict()
+        values.update(changes)
+        return FrozenConfig(values)
+
+    def sweep_params(self):
+        'Names of the parameters with several values'
+        return [name for name, value in self.values.items() if isinstance(value, tuple)]
+
+    def base(self):
+        'Config without sweep, every sweep parameter takes its first value'
+        return self.replace(**{name: self.values[name][0] for name in self.sweep_params()})
+
+    def grid(self):
+        'Full factorial Grid over the values of all sweep parameters (labels = parameter names)'
+        names = self.sweep_params()
+        if not names:
+            raise ValueError("Config has no parameter with several values")
+        return Grid(*[np.asarray(self.values[name]) for name in names], labels = names)
+
+    def expand(self):
+        'One config per node of grid()'
+        names = self.sweep_params()
+        if not names:
+            return [self]
+        base = self.base()
+        types = {name: type(self.values[name][0]) for name in names}
+        return [base.replace(**{name: types[name](value) for name, value in zip(names, node)})
+                for node in self.grid().nodes]
+
+def read_yaml(config_file):
+    'Values of a YAML config file, every file is only parsed again when it changed'
+    path = os.path.abspath(config_file)
+    stat = os.stat(path)
+    cached = yaml_cache.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    import yaml
+    with open(path, 'r') as file:
+        values = yaml.safe_load(file) or {}
+    if not isinstance(values, dict):
+        raise ValueError(f'Config file "{config_file}" does not contain parameter: value pairs')
+
+    yaml_cache[path] = (stat.st_mtime_ns, stat.st_size, values)
+    return values
+
+class ConfigSchema:
+    """ Typed parameters of a model, loads them as FrozenConfig with priority cmd line > config file > default
+
+    The command line is only parsed if args are passed (e.g. sys.argv[1:]), so loading works the same in
+    scripts, workers and notebooks.
+
+        schema = ConfigSchema(Param("amp", float, 1.0), Param("nx", int, 100))
+        config = schema.load("sim_para.yaml", args = sys.argv[1:])
+    """
+    def __init__(self, *params):
+        self.params = {param.name: param for param in params}
+
+    def create_parser(self):
+        parser = argparse.ArgumentParser()
+        parser.add_argument('-c', dest = "config_file", default = None, help = 'config file path')
+        for param in self.params.values():
+            # Comma separated values give a sweep, e.g. --freq 0.5,1,2
+            parser.add_argument('--' + param.name, default = None, type = str, help = param.help)
+        return parser
+
+    def parse_args(self, args):
+        'Config file and values given on the command line'
+        parsed = vars(self.create_parser().parse_args(args))
+        config_file = parsed.pop("config_file")
+        values = {}
+        for name, value in parsed.items():
+            if value is not None:
+                values[name] = value.split(",") if "," in value else value
+        return config_file, values
+
+    def load(self, config_file = None, args = None, **overrides):
+        values = {name: param.default for name, param in self.params.items()}
+
+        cmd_values = {}
+        if args is not None:
+            cmd_file, cmd_values = self.parse_args(args)
+            config_file = cmd_file if cmd_file is not None else config_file
+
+        if config_file is not None:
+            file_values = read_yaml(config_file)
+            for name in file_values:
+                if name not in self.params:
+                    print(f'Unknown parameter "{name}" in "{config_file}". Skiped parameter')
+            values.update({name: value for name, value in file_values.items() if name in self.params})
+
+        for name in overrides:
+            if name not in self.params:
+                raise ValueError(f'Unknown parameter "{name}"')
+
+        values.update(cmd_values)
+        values.update(overrides)
+
+        return FrozenConfig({name: self.params[name].cast(value) for name, value in values.items()})
+
+    def format_values(self, config):
+        return "\n".join(f"  {name}: {value}" for name, value in config.values.items())
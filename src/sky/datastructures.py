@@ -1,5 +1,4 @@
 import numpy as np
-from scipy import interpolate
 
 class Grid:
     def __init__(self, *dimension_samples, labels = ["x", "y", "z"]):
@@ -72,6 +71,7 @@ class Grid:
         return fun_evals_grid
 
     def create_interpolator(self, fun_evals):
+        from scipy import interpolate
 
         interpolator = []
 
@@ -149,17 +149,303 @@ class GridData:
         self.n_samples = data.shape[1]
         self.label = label
 
-    def get_shaped_data(self):
-        'Returns data of shape n_samples x d_1 x d_2 x d_n'
+    def get_shaped_data(self, sample = None):
+        'Returns data of shape n_samples x d_1 x d_2 x d_n, optionally only of the samples with the given indices'
+
+        values = self.values if sample is None else self.values[:, sample]
 
         if self.domain.n_dim == 1:
-            shaped_data = self.values.T
+            shaped_data = values.T
 
         elif self.domain.n_dim == 2:
-            shaped_data = np.zeros((self.n_samples, self.domain.n_nodes_per_dim[0], self.domain.n_nodes_per_dim[1]))
-
-            for idx, data_point in enumerate(self.values.T):
-                shaped_data[idx,:,:] = self.domain.reshape_data(data_point)
+            # Same layout as Grid.reshape_data for every sample
+            shaped_data = values.T.reshape(-1, self.domain.n_nodes_per_dim[1], self.domain.n_nodes_per_dim[0])
         
         return shaped_data
 
+
+class TriMesh:
+    """ Triangle mesh (e.g. of a FE model) shared by all fields plotted on it
+
+    The matplotlib Triangulation and the structures derived from it (trifinder, refined meshes) are
+    built on first use and cached. TriContourPlots keep the mesh by reference, so many plots on one
+    mesh build the triangulation once and pickled plot data stores the coordinates once. The caches
+    are not pickled.
+
+        mesh = TriMesh(x, y, triangles)
+        plots = [TriContourPlot.from_mesh(mesh, field) for field in fields]
+    """
+    def __init__(self, x, y, triangles = None, mask = None):
+        self.x = np.asarray(x, dtype = float)
+        self.y = np.asarray(y, dtype = float)
+        self.triangles = None if triangles is None else np.asarray(triangles, dtype = int)
+        self.mask = mask
+        self.clear_cache()
+
+    @property
+    def n_nodes(self):
+        return self.x.size
+
+    def clear_cache(self):
+        self.triangulation = None
+        self.trifinder = None
+        self.refiner = None
+        self.refined = {}
+
+    def get_triangulation(self):
+        if self.triangulation is None:
+            import matplotlib.tri as mtri
+            self.triangulation = mtri.Triangulation(self.x, self.y, triangles = self.triangles, mask = self.mask)
+        return self.triangulation
+
+    def get_trifinder(self):
+        if self.trifinder is None:
+            self.trifinder = self.get_triangulation().get_trifinder()
+        return self.trifinder
+
+    def find_triangles(self, x, y):
+        'Index of the triangle containing each point, -1 outside of the mesh'
+        return self.get_trifinder()(x, y)
+
+    def get_refiner(self):
+        if self.refiner is None:
+            import matplotlib.tri as mtri
+            self.refiner = mtri.UniformTriRefiner(self.get_triangulation())
+        return self.refiner
+
+    def refine(self, subdiv = 2):
+        'Uniformly refined triangulation (every triangle split into 4**subdiv) and the parent triangle of each new one'
+        if subdiv not in self.refined:
+            self.refined[subdiv] = self.get_refiner().refine_triangulation(return_tri_index = True, subdiv = subdiv)
+        return self.refined[subdiv]
+
+    def refine_field(self, z, subdiv = 2):
+        'Refined triangulation and z interpolated on it (cubic), for smooth contours of coarse meshes'
+        return self.get_refiner().refine_field(z, subdiv = subdiv)
+
+    def interpolate(self, z, x, y, kind = "linear"):
+        'Interpolates the nodal field z at the points x, y (masked outside of the mesh)'
+        import matplotlib.tri as mtri
+        if kind == "linear":
+            interpolator = mtri.LinearTriInterpolator(self.get_triangulation(), z, trifinder = self.get_trifinder())
+        elif kind == "cubic":
+            interpolator = mtri.CubicTriInterpolator(self.get_triangulation(), z, trifinder = self.get_trifinder())
+        else:
+            raise ValueError(f'Unknown interpolation kind "{kind}", use "linear" or "cubic"')
+        return interpolator(x, y)
+
+    def __getstate__(self):
+        # The cached matplotlib objects are rebuilt after loading
+        state = dict(self.__dict__)
+        state.update(triangulation = None, trifinder = None, refiner = None, refined = {})
+        return state
+
+class StreamingHistogram:
+    """ Histogram accumulated chunk by chunk, for data that does not fit into memory
+
+    Chunks can come from generators, memmaps or GridData (see iter_chunks). The bin edges are fixed
+    by bins (edges or number of bins) and range; without a range they are estimated from a sketch of
+    the first sketch_size values, later values outside of the edges are counted in underflow/overflow.
+    Histograms with the same edges are merged with merge, histogram_files accumulates many files in a
+    process pool. HistPlot draws a StreamingHistogram with ax.stairs.
+
+        hist = StreamingHistogram(bins = 200, range = (-5, 5)).update(iter_chunks(np.load(file, mmap_mode = "r")))
+        plot = HistPlot(hist)
+    """
+    def __init__(self, bins = 100, range = None, sketch_size = 2**20):
+        self.bins = bins
+        self.range = range
+        self.sketch_size = sketch_size
+
+        self.edges = None
+        self.counts = None
+        self.uniform = False
+        self.underflow = 0
+        self.overflow = 0
+        self.n_nan = 0
+        self.sketch = []
+        self.n_sketch = 0
+
+        if np.ndim(bins) == 1:
+            self.set_edges(np.asarray(bins, dtype = float))
+        elif range is not None and not isinstance(bins, str):
+            self.set_edges(np.linspace(range[0], range[1], bins + 1))
+
+    @classmethod
+    def from_data(cls, data, bins = 10, range = None, chunk_size = 2**20, sample = None):
+        'Histogram of an array, memmap or GridData, the range is taken from a first pass over the data like np.histogram'
+        if range is None and np.ndim(bins) == 0:
+            range = data_range(iter_chunks(data, chunk_size, sample))
+        return cls(bins, range).update(iter_chunks(data, chunk_size, sample)).finalize()
+
+    def set_edges(self, edges):
+        if edges.ndim != 1 or edges.size < 2 or np.any(np.diff(edges) <= 0):
+            raise ValueError("Bin edges must be increasing and contain at least two values")
+        self.edges = edges
+        self.counts = np.zeros(edges.size - 1, dtype = np.int64)
+        widths = np.diff(edges)
+        self.uniform = np.allclose(widths, widths[0])
+
+    def add(self, values):
+        'Adds the values of one chunk, NaN and inf are counted in n_nan'
+        values = np.asarray(values).reshape(-1)
+        finite = np.isfinite(values)
+        n_finite = np.count_nonzero(finite)
+        if n_finite < values.size:
+            self.n_nan += values.size - n_finite
+            values = values[finite]
+
+        if self.edges is None:
+            self.sketch.append(np.array(values, dtype = float))
+            self.n_sketch += values.size
+            if self.n_sketch >= self.sketch_size:
+                self.fix_edges()
+            return self
+
+        self.accumulate(values)
+        return self
+
+    def update(self, chunks):
+        for chunk in chunks:
+            self.add(chunk)
+        return self
+
+    def accumulate(self, values):
+        low, high = self.edges[0], self.edges[-1]
+        if self.uniform:
+            # np.histogram only takes the fast path (no sorting or searching) for equal bins given as number and range
+            counts, _ = np.histogram(values, bins = self.counts.size, range = (low, high))
+        else:
+            counts, _ = np.histogram(values, bins = self.edges)
+        self.counts += counts
+        self.underflow += np.count_nonzero(values < low)
+        self.overflow += np.count_nonzero(values > high)
+
+    def fix_edges(self):
+        'Bin edges from the sketch (bins as in np.histogram_bin_edges), the sketched values are added afterwards'
+        sketch = np.concatenate(self.sketch) if self.sketch else np.zeros(0)
+        self.sketch = []
+        self.n_sketch = 0
+        if sketch.size == 0 and self.range is None:
+            raise ValueError("No values to estimate the bin edges, pass a range")
+        self.set_edges(np.histogram_bin_edges(sketch, self.bins, self.range))
+        self.accumulate(sketch)
+
+    def finalize(self):
+        'Fixes the bin edges if they are still estimated from the sketch'
+        if self.edges is None:
+            self.fix_edges()
+        return self
+
+    def empty_copy(self):
+        'Histogram with the same bin edges and no values, e.g. for the partial histograms of workers'
+        return StreamingHistogram(self.finalize().edges, sketch_size = self.sketch_size)
+
+    def merge(self, *others):
+        'Adds the counts of histograms with the same bin edges'
+        self.finalize()
+        for other in others:
+            other.finalize()
+            if not np.array_equal(self.edges, other.edges):
+                raise ValueError("Only histograms with the same bin edges can be merged")
+            self.counts += other.counts
+            self.underflow += other.underflow
+            self.overflow += other.overflow
+            self.n_nan += other.n_nan
+        return self
+
+    @property
+    def n_values(self):
+        'Number of values within the bin edges'
+        return int(self.finalize().counts.sum())
+
+    def density(self):
+        'Counts normalised to an integral of one (np.histogram(..., density = True))'
+        self.finalize()
+        return self.counts / (self.counts.sum() * np.diff(self.edges))
+
+def iter_chunks(data, chunk_size = 2**20, sample = None):
+    """ Chunks of about chunk_size values of an array, memmap or GridData (optionally only the column sample)
+
+    Memmaps are read chunk by chunk. Any other iterable (e.g. a generator of arrays) is passed through.
+    """
+    if isinstance(data, GridData):
+        values = data.values if sample is None else data.values[:, sample]
+        if values.ndim == 1:
+            values = values.reshape(-1, 1)
+        n_rows = max(1, chunk_size // max(values.shape[1], 1))
+        for start in range(0, values.shape[0], n_rows):
+            yield values[start:start + n_rows]
+        return
+
+    if isinstance(data, np.ndarray):
+        # Reshaping a contiguous memmap gives a view, it is still read chunk by chunk
+        values = data.reshape(-1) if data.flags.c_contiguous else data.ravel(order = "K")
+        for start in range(0, values.size, chunk_size):
+            yield values[start:start + chunk_size]
+        return
+
+    yield from data
+
+def data_range(chunks):
+    'Minimum and maximum of all finite values of the chunks, None if there are none'
+    low, high = np.inf, -np.inf
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        if chunk.size == 0:
+            continue
+        chunk_low, chunk_high = np.nanmin(chunk), np.nanmax(chunk)
+        if not np.isfinite(chunk_low) or not np.isfinite(chunk_high):
+            finite = chunk[np.isfinite(chunk)]
+            if finite.size == 0:
+                continue
+            chunk_low, chunk_high = finite.min(), finite.max()
+        low, high = min(low, chunk_low), max(high, chunk_high)
+    if low > high:
+        return None
+    return (float(low), float(high))
+
+def load_memmap(file):
+    return np.load(file, mmap_mode = "r")
+
+def file_range(file, loader, chunk_size):
+    return data_range(iter_chunks(loader(file), chunk_size))
+
+def file_histogram(file, histogram, loader, chunk_size):
+    return histogram.empty_copy().update(iter_chunks(loader(file), chunk_size))
+
+def histogram_files(files, bins = 100, range = None, loader = load_memmap, chunk_size = 2**20, n_workers = None):
+    """ StreamingHistogram of the values of many files, the files are read in a process pool
+
+    loader(file) returns an array, memmap or GridData (default: np.load(file, mmap_mode = "r")). Without
+    a range a first pass determines the minimum and maximum of all files. The partial histograms of the
+    files are merged.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import repeat
+    files = list(files)
+    if len(files) == 0:
+        raise ValueError("No files to read")
+
+    pool = ProcessPoolExecutor(n_workers) if n_workers != 1 else None
+    map_files = pool.map if pool is not None else map
+    try:
+        if range is None and np.ndim(bins) == 0:
+            limits = [limit for limit in map_files(file_range, files, repeat(loader), repeat(chunk_size)) if limit is not None]
+            if not limits:
+                raise ValueError("The files contain no finite values")
+            range = (min(limit[0] for limit in limits), max(limit[1] for limit in limits))
+
+        histogram = StreamingHistogram(bins, range)
+        if histogram.edges is None:
+            # Bins estimated by name ("auto", "fd", ...): sketch the beginning of the first file
+            for chunk in iter_chunks(loader(files[0]), chunk_size):
+                if histogram.add(chunk).edges is not None:
+                    break
+            histogram.finalize()
+
+        partials = map_files(file_histogram, files, repeat(histogram), repeat(loader), repeat(chunk_size))
+        return histogram.empty_copy().merge(*partials)
+    finally:
+        if pool is not None:
+            pool.shutdown()
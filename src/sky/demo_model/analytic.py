@@ -1,5 +1,6 @@
-from sky.plotlib import *
-from sky.datastructures import *
+import numpy as np
+from sky.datastructures import Grid
+from sky.demo_model.cache import cached_model
 
 class analytic_model_1d():
     def __init__(self, config, logger = None) -> None:
@@ -17,17 +18,42 @@ class analytic_model_1d():
 
         if self.logger is not None: self.logger.info("Mod 1 finished calculation \n")
 
+        if returnType == "plot":
+            return self.create_plot(x, y)
+        elif returnType == "numpy":
+            return y
 
-        plt = LinePlot(x,y)
-        plt.x_label = self.xlabel
-        plt.y_label = self.ylabel
-        plt.color_no = 0
+    def calculate_batch(self, x, amp = None, freq = None, returnType = "numpy"):
+        """ Evaluates many parameter sets in one broadcast operation
+
+        amp and freq are scalars or arrays of length n_params, missing ones are taken from the config.
+        Returns an array of shape n_x x n_params, which can be used as GridData.values directly.
+        """
+        if self.logger is not None: self.logger.info("Mod 1 started batch calculation")
+
+        amp = np.atleast_1d(self.amp if amp is None else amp)
+        freq = np.atleast_1d(self.freq if freq is None else freq)
+        amp, freq = np.broadcast_arrays(amp, freq)
+
+        x = np.asarray(x).reshape(-1, 1)
+        y = amp * np.sin((2 * np.pi * x) * freq)
+
+        if self.logger is not None: self.logger.info(f"Mod 1 finished batch calculation of {y.shape[1]} parameter sets \n")
 
         if returnType == "plot":
-            return plt
+            return self.create_plot(x[:,0], y)
         elif returnType == "numpy":
             return y
-        
+
+    def create_plot(self, x, y):
+        # Plot classes are only imported when a plot is requested
+        from sky.plotlib import LinePlot
+
+        plt = LinePlot(x,y)
+        plt.x_label = self.xlabel
+        plt.y_label = self.ylabel
+        plt.color_no = 0
+        return plt
 
 class analytic_model_2d():
     def __init__(self, logger = None) -> None:
@@ -39,21 +65,31 @@ class analytic_model_2d():
 
         if self.logger is not None: self.logger.info("Mod 2 started calculation")
 
-        grid = Grid(x, y)
-        y = np.sin(grid.nodes[:,0]) * np.cos(grid.nodes[:,1])
+        # Evaluated on the grid axes, same node order as Grid(x, y).nodes without building the nodes
+        z = (np.cos(y).reshape(-1, 1) * np.sin(x).reshape(1, -1)).reshape(-1)
 
         if self.logger is not None: self.logger.info("Mod 2 finished calculation \n")
 
-        plt = ContourPlot(grid, y)
-
         if returnType == "plot":
-            return plt 
+            from sky.plotlib import ContourPlot
+            return ContourPlot(Grid(x, y), z)
         elif returnType == "numpy":
-            return y
-
+            return z
 
+    def calculate_batch(self, x, y = None, returnType = "numpy"):
+        """ Evaluates the model on the axes of a Grid (or on x and y)
 
+        The model has no parameters, the result has the shape n_nodes x 1 to be used as GridData.values.
+        """
+        if isinstance(x, Grid):
+            x, y = x.dimension_samples[0], x.dimension_samples[1]
 
+        z = self.calculate(x, y, returnType = returnType)
 
-    
+        if returnType == "numpy":
+            return z.reshape(-1, 1)
+        return z
 
+# Memoised variants (results/_cache), opt-in since every new result is written to disk
+cached_analytic_model_1d = cached_model(name = "cached_analytic_model_1d")(analytic_model_1d)
+cached_analytic_model_2d = cached_model(name = "cached_analytic_model_2d")(analytic_model_2d)
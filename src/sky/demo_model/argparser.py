@@ -1,22 +1,34 @@
 import os
 import shutil
-import configargparse
+from sky.config import ConfigSchema, Param
+from sky.filemanager import SnapshotStore
+from sky.runindex import record_run
 
-def get_config_demo_model(config_file, result_folder, logger = None):
+demo_model_schema = ConfigSchema(Param('amp', float, 1.0, help = 'Amplitude of Model 1'),
+                                 Param('nx', int, 100, help = 'Spatial discretization'),
+                                 Param('freq', float, 10, help = 'frequency'))
 
-    p = configargparse.ArgParser(config_file_parser_class=configargparse.YAMLConfigFileParser)
-    p.add('-c', default = config_file, is_config_file=True, help='config file path')
-    p.add('--amp', default = 1.0, type=float, help='Amplitude of Model 1')
-    p.add('--nx', default = 100, type=float, help='Spatial discretization')
-    p.add('--freq', default = 10, type=float, help='frequency')
-    
-    config = p.parse_args()
+def get_config_demo_model(config_file, result_folder, logger = None, snapshot = None, args = None):
+    """ FrozenConfig of the demo model (cmd line > config file > defaults)
+
+    The command line is only used if args are given, e.g. args = sys.argv[1:]. List values in the config
+    file (freq: [0.5, 1, 2]) define a sweep, see FrozenConfig.grid and sweep.run_config_sweep.
+    """
+    config = demo_model_schema.load(config_file, args = args)
 
     # write configs to logger
-    if logger is not None: logger.info("User input (cmd > config > default): \n" + p.format_values())    
+    if logger is not None: logger.info("User input (cmd > config > default): \n" + demo_model_schema.format_values(config))
 
-    # Copy config file to result path
+    # Copy config file to result path, once per result folder
     config_filename = os.path.basename(config_file)
-    shutil.copy(config_file, result_folder + "/" + config_filename)
+    target = os.path.join(result_folder, config_filename)
+    if not os.path.exists(target):
+        if snapshot is None:
+            shutil.copy(config_file, target)
+        else:
+            SnapshotStore().add_to_run(config_file, result_folder, config_filename, mode = snapshot)
+
+    # Make the run searchable by its config values
+    record_run(result_folder, params = config.to_dict())
 
-    return config
\ No newline at end of file
+    return config
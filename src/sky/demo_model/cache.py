@@ -0,0 +1,212 @@
+import os
+import json
+import hashlib
+import inspect
+import logging
+from collections import OrderedDict
+from functools import wraps
+import numpy as np
+from sky.datastructures import Grid, GridData
+
+class ResultCache:
+    """ Two tier cache for model results
+
+    Results are kept in memory (LRU, memory_items entries) and as .npy files in cache_dir. Files are
+    loaded memory mapped; when the files exceed max_bytes, the least recently used ones are removed.
+    """
+    def __init__(self, cache_dir = "results/_cache", max_bytes = 2**30, memory_items = 32):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.memory = OrderedDict()
+
+    def file_path(self, key):
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+
+        file_path = self.file_path(key)
+        try:
+            value = np.load(file_path, mmap_mode = 'r')
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # Mark as recently used for the eviction
+        os.utime(file_path)
+        self.remember(key, value)
+        return value
+
+    def put(self, key, value):
+        value = np.array(value)
+        value.setflags(write = False)
+        self.remember(key, value)
+
+        os.makedirs(self.cache_dir, exist_ok = True)
+        tmp_file = f"{self.file_path(key)}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as file:
+            np.save(file, value)
+        os.replace(tmp_file, self.file_path(key))
+
+        self.evict()
+        return value
+
+    def remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last = False)
+
+    def evict(self):
+        with os.scandir(self.cache_dir) as entries:
+            files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries
+                     if entry.name.endswith(".npy")]
+
+        total_bytes = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def clear(self):
+        self.memory.clear()
+        if os.path.isdir(self.cache_dir):
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith(".npy"):
+                    os.remove(os.path.join(self.cache_dir, filename))
+
+default_cache = None
+
+def get_default_cache():
+    global default_cache
+    if default_cache is None:
+        default_cache = ResultCache()
+    return default_cache
+
+def config_values(config):
+    if config is None:
+        return {}
+    if isinstance(config, dict):
+        return dict(config)
+    if hasattr(config, "to_dict"):
+        return config.to_dict()
+    return dict(vars(config))
+
+def hash_arguments(arg_hash, value):
+    """ Adds an argument to the hash by its content
+
+    Arrays, numbers, strings, lists, tuples, dicts, Grid and GridData are supported. Other objects raise a
+    ValueError, their str() (e.g. with the memory address) would give a new cache entry on every call.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        arg_hash.update(json.dumps(value).encode())
+    elif isinstance(value, np.generic):
+        hash_arguments(arg_hash, value.item())
+    elif isinstance(value, Grid):
+        arg_hash.update(b"Grid")
+        hash_arguments(arg_hash, list(value.labels))
+        hash_arguments(arg_hash, list(value.dimension_samples))
+    elif isinstance(value, GridData):
+        arg_hash.update(b"GridData")
+        hash_arguments(arg_hash, [value.domain, value.values, value.label])
+    elif isinstance(value, dict):
+        arg_hash.update(f"dict{len(value)}".encode())
+        for key in sorted(value, key = str):
+            hash_arguments(arg_hash, str(key))
+            hash_arguments(arg_hash, value[key])
+    elif isinstance(value, (np.ndarray, list, tuple)):
+        try:
+            array = np.asarray(value)
+        except ValueError:
+            # Ragged, e.g. the dimension samples of a grid
+            array = None
+        if array is not None and array.dtype.kind in "biufc":
+            array = np.ascontiguousarray(array)
+            arg_hash.update(f"{array.dtype}{array.shape}".encode())
+            arg_hash.update(array.tobytes())
+        else:
+            # Strings or mixed content, element by element
+            arg_hash.update(f"{type(value).__name__}{len(value)}".encode())
+            for item in value:
+                hash_arguments(arg_hash, item)
+    else:
+        raise ValueError(f"Can not create a cache key for an argument of type {type(value).__name__}")
+
+def create_key(model, method_name, args, kwargs):
+    key_hash = hashlib.sha256()
+    key_hash.update(f"{model._cache_model_name}.{method_name}".encode())
+    hash_arguments(key_hash, model._cache_config)
+    for value in args:
+        hash_arguments(key_hash, value)
+    for name in sorted(kwargs):
+        key_hash.update(name.encode())
+        hash_arguments(key_hash, kwargs[name])
+    return key_hash.hexdigest()
+
+def cached_model(cache = None, methods = ("calculate", "calculate_batch"), name = None):
+    """ Class decorator which memoises the numpy results of the model methods
+
+    The cache key consists of the model class, the config values passed to __init__ (e.g. from
+    get_config_demo_model) and a hash of the arguments. Hits and misses are logged to the model logger
+    or to 'mylogger'. Results requested as plot are always computed.
+
+    Caching is opt-in: every miss writes the result to the cache folder and hits return read-only
+    arrays. The decorator returns a subclass, so existing models can be wrapped without changing them
+    (sky.demo_model.analytic has cached_analytic_model_1d/2d). A wrapped model needs the name of the module
+    attribute it is assigned to, otherwise it can not be pickled (e.g. for sweeps in worker processes).
+
+        @cached_model(ResultCache("results/_cache", max_bytes = 2**30))
+        class my_model(): ...
+
+        cached_model_1d = cached_model(name = "cached_model_1d")(analytic_model_1d)
+    """
+    def decorate(model_class):
+        original_init = model_class.__init__
+        init_signature = inspect.signature(original_init)
+
+        @wraps(original_init)
+        def __init__(self, *args, **kwargs):
+            original_init(self, *args, **kwargs)
+            arguments = init_signature.bind(self, *args, **kwargs).arguments
+            self._cache_config = config_values(arguments.get("config"))
+
+        class_name = name or model_class.__name__
+        # The cache keys use the name of the model, they do not depend on how it was wrapped
+        namespace = {"__init__": __init__, "__module__": model_class.__module__, "__qualname__": class_name,
+                     "__doc__": model_class.__doc__,
+                     "_cache_model_name": f"{model_class.__module__}.{model_class.__qualname__}"}
+        for method_name in methods:
+            if hasattr(model_class, method_name):
+                namespace[method_name] = cached_method(getattr(model_class, method_name), method_name, cache)
+
+        return type(class_name, (model_class,), namespace)
+
+    return decorate
+
+def cached_method(method, method_name, cache):
+
+    @wraps(method)
+    def wrapper(self, *args, returnType = "numpy", **kwargs):
+        if returnType != "numpy":
+            return method(self, *args, returnType = returnType, **kwargs)
+
+        result_cache = cache if cache is not None else get_default_cache()
+        logger = getattr(self, "logger", None) or logging.getLogger('mylogger')
+
+        key = create_key(self, method_name, args, kwargs)
+        value = result_cache.get(key)
+        if value is not None:
+            logger.info(f"Cache hit: {type(self).__name__}.{method_name} ({key[0:12]})")
+            return value
+
+        logger.info(f"Cache miss: {type(self).__name__}.{method_name} ({key[0:12]})")
+        value = method(self, *args, returnType = returnType, **kwargs)
+        return result_cache.put(key, value)
+
+    return wrapper
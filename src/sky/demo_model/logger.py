@@ -1,23 +1,229 @@
+import os
+import json
+import queue
+import atexit
 import logging
-import subprocess
+import logging.handlers
+import multiprocessing
+from datetime import datetime
+from sky.runindex import record_run
 
-def init_logger(save_dir, logfile, log_level=logging.INFO):
+LOGGER_NAME = 'mylogger'
 
-    log_file = save_dir + "/" + logfile + ".log"
+# Attributes every LogRecord has, everything else was passed with extra = {...}
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
 
-    logger = logging.getLogger('mylogger')
+# The running listener of 'mylogger', the file it writes to and its queue
+listener = None
+listener_config = None
+listener_queue = None
+git_hash_cache = {}
+
+# Fields added to every record of this process (worker, chunk), see set_log_context
+log_context = {"worker": "main", "chunk": "-"}
+
+class JsonFormatter(logging.Formatter):
+    'One JSON object per line: time, level, logger, message and all extra fields'
+    def format(self, record):
+        entry = {"time": datetime.fromtimestamp(record.created).isoformat(timespec = "milliseconds"),
+                 "level": record.levelname,
+                 "logger": record.name,
+                 "message": record.getMessage()}
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default = str)
+
+class FastQueueHandler(logging.handlers.QueueHandler):
+    """ Only resolves the message before queueing the record
+
+    The default QueueHandler formats and copies every record in the calling thread. Within one process the
+    record can be passed on as is, formatting is left to the listener thread.
+    """
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+class ContextFilter(logging.Filter):
+    'Adds the fields of log_context (worker and chunk id) to every record'
+    def filter(self, record):
+        for key, value in log_context.items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+def set_log_context(**fields):
+    'Sets fields added to all following records of this process, e.g. set_log_context(chunk = 3)'
+    log_context.update(fields)
+
+def get_log_queue():
+    'Queue of the running multi-process logger (init_logger(..., multiprocess = True)), None otherwise'
+    if listener_config is None or not listener_config[3]:
+        return None
+    return listener_queue
+
+def init_worker_logger(log_queue, worker_id = None):
+    """ Sends the records of 'mylogger' in a worker process to the listener of the parent
+
+    Use as initializer of the process pool:
+        ProcessPoolExecutor(initializer = init_worker_logger, initargs = (get_log_queue(),))
+    """
+    global listener, listener_config
+    # A forked worker inherits the listener state of the parent, it must not write to the file itself
+    listener = None
+    listener_config = None
+    log_context["worker"] = worker_id if worker_id is not None else multiprocessing.current_process().name
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.INFO)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    # The stock QueueHandler formats the record, so exceptions and arguments can be pickled
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.sky_queue_handler = True
+    logger.addHandler(queue_handler)
+    return logger
+
+def find_git_dir(path = "."):
+    'The .git directory of the checkout containing path, .git files of worktrees and submodules are followed'
+    path = os.path.abspath(path)
+    while True:
+        git_path = os.path.join(path, ".git")
+        if os.path.isdir(git_path):
+            return git_path
+        if os.path.isfile(git_path):
+            with open(git_path, 'r') as file:
+                content = file.read().strip()
+            if content.startswith("gitdir:"):
+                return os.path.normpath(os.path.join(path, content[len("gitdir:"):].strip()))
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+def read_ref(git_dir, ref):
+    for folder in [git_dir, get_common_dir(git_dir)]:
+        ref_file = os.path.join(folder, ref)
+        if os.path.isfile(ref_file):
+            with open(ref_file, 'r') as file:
+                return file.read().strip()
+
+        packed_refs = os.path.join(folder, "packed-refs")
+        if os.path.isfile(packed_refs):
+            with open(packed_refs, 'r') as file:
+                for line in file:
+                    parts = line.strip().split(" ")
+                    if len(parts) == 2 and parts[1] == ref:
+                        return parts[0]
+    return None
+
+def get_common_dir(git_dir):
+    'Worktrees keep their refs in the main .git directory'
+    common_file = os.path.join(git_dir, "commondir")
+    if not os.path.isfile(common_file):
+        return git_dir
+    with open(common_file, 'r') as file:
+        return os.path.normpath(os.path.join(git_dir, file.read().strip()))
+
+def get_git_hash(path = "."):
+    'Commit hash of the checkout containing path read from the .git files (cached), None outside of git'
+    git_dir = find_git_dir(path)
+    if git_dir is None:
+        return None
+    if git_dir in git_hash_cache:
+        return git_hash_cache[git_dir]
+
+    commit_hash = None
+    try:
+        with open(os.path.join(git_dir, "HEAD"), 'r') as file:
+            head = file.read().strip()
+        commit_hash = read_ref(git_dir, head[len("ref:"):].strip()) if head.startswith("ref:") else head
+    except OSError:
+        pass
+
+    git_hash_cache[git_dir] = commit_hash
+    return commit_hash
+
+def stop_logger():
+    'Writes all queued records and closes the log file'
+    global listener, listener_config, listener_queue
+    if listener is None:
+        return
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        if getattr(handler, "sky_queue_handler", False):
+            logger.removeHandler(handler)
+
+    listener = None
+    listener_config = None
+    listener_queue = None
+
+def init_logger(save_dir, logfile, log_level=logging.INFO, structured=False, multiprocess=False):
+    """ Logger 'mylogger' writing to save_dir/logfile.log (or .jsonl with structured=True)
+
+    Records are put into a queue and written to the file by a background thread, logging does not wait
+    for the disk. Calling init_logger again with the same file returns the running logger, with another
+    file the old one is closed first. Extra fields (logger.info(..., extra = {"step": 3})) are part of
+    the structured records.
+
+    With multiprocess=True the queue is a multiprocessing queue: workers initialised with
+    init_worker_logger(get_log_queue()) send their records to this listener, which writes one log for
+    all processes. Every record carries the worker and chunk id (set_log_context).
+    """
+    global listener, listener_config, listener_queue
+
+    log_file = os.path.join(save_dir, logfile + (".jsonl" if structured else ".log"))
+    logger = logging.getLogger(LOGGER_NAME)
     logger.setLevel(logging.INFO)
 
+    config = (os.path.abspath(log_file), log_level, structured, multiprocess)
+    if listener is not None and listener_config == config:
+        return logger
+    stop_logger()
+
     file_handler = logging.FileHandler(log_file, 'w')
-    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    if structured:
+        file_handler.setFormatter(JsonFormatter())
+    elif multiprocess:
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - [%(worker)s|%(chunk)s] - %(message)s'))
+    else:
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
     file_handler.setLevel(log_level)
-    logger.addHandler(file_handler)
 
-    commit_hash = subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
+    if multiprocess:
+        # Records are pickled into the queue, they are formatted before like in the workers
+        log_queue = multiprocessing.Queue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+    else:
+        log_queue = queue.SimpleQueue()
+        queue_handler = FastQueueHandler(log_queue)
+    queue_handler.sky_queue_handler = True
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level = True)
+    listener.start()
+    listener_config = config
+    listener_queue = log_queue
+
+    commit_hash = get_git_hash()
+    if commit_hash is not None:
+        record_run(save_dir, git_hash = commit_hash)
 
     logger.info(f"-------------------------------")
     logger.info(f"--------Start logging ---------")
     logger.info(f"-------------------------------\n")
-    logger.info(f"Current git hash: {commit_hash}")
+    logger.info(f"Current git hash: {commit_hash if commit_hash is not None else 'unknown (no git checkout)'}")
+
+    return logger
 
-    return logger
\ No newline at end of file
+atexit.register(stop_logger)
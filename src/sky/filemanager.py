@@ -1,13 +1,289 @@
-import os
-from datetime import datetime, date
+import os, re, sys, json, stat, time
+import hashlib
 import shutil
+import sqlite3
+import threading
+from datetime import datetime, date
+from sky.runindex import RunIndex, record_run, remove_from_index
+
+# Bookkeeping of a results directory: manifest, lock file and trash are kept in a hidden sub folder.
+# Changes in there do not touch the modification time of the results directory itself.
+META_NAME = ".sky"
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "retention.lock"
+TRASH_NAME = "trash"
+# Number of removed folder names remembered in the manifest, they are not handed out again
+MAX_REMOVED_NAMES = 1000
+SNAPSHOT_ROOT = "results/_snapshots"
+
+# Length and pattern of the time stamp in front of the folder names. Both formats are zero padded,
+# so sorting the stamp strings is the same as sorting the dates.
+STAMP_FORMATS = {'%Y-%m-%d': (10, re.compile(r'\d{4}-\d{2}-\d{2}')),
+                 '%H_%M_%S': (8, re.compile(r'\d{2}_\d{2}_\d{2}'))}
 
 def all_subdirs_of(b='.'):
-    result = []
-    for d in os.listdir(b):
-        bd = os.path.join(b, d)
-        if os.path.isdir(bd): result.append(d)
-    return result
+    with os.scandir(b) as entries:
+        return [entry.name for entry in entries if entry.is_dir()]
+
+class RetentionManager:
+    """ Keeps the time stamped folders of one results directory and removes the oldest ones
+
+    The folder names are cached in a small manifest next to the folders. The manifest is only trusted while
+    it is newer than the directory itself, otherwise the directory is scanned again. Every folder is
+    stored with its time stamp and the time it was added (time_ns), folders of the same second are
+    removed in the order they were created. Removed folders are moved into a trash directory and deleted
+    by a background thread, their names are remembered (reserved_names) so they are not reused. Use
+    lock() to serialise pruning between parallel runs.
+    """
+    def __init__(self, path, date_format, async_delete = True):
+        self.path = path
+        self.date_format = date_format
+        self.async_delete = async_delete
+        self.max_idx, self.stamp_pattern = STAMP_FORMATS[date_format]
+        self.meta_path = os.path.join(path, META_NAME)
+        self.manifest_path = os.path.join(self.meta_path, MANIFEST_NAME)
+        self.trash_path = os.path.join(self.meta_path, TRASH_NAME)
+        self.folders = None
+        self.removed = []
+
+    def lock(self, timeout = 30, stale = 600):
+        os.makedirs(self.meta_path, exist_ok = True)
+        return FolderLock(os.path.join(self.meta_path, LOCK_NAME), timeout = timeout, stale = stale)
+
+    def parse_stamp(self, folder):
+        stamp = folder[0:self.max_idx]
+        if self.stamp_pattern.fullmatch(stamp):
+            return stamp
+        return None
+
+    def scan(self, known = None):
+        'Folders of the directory, creation times of known folders are kept'
+        known = known or {}
+        folders = {}
+        for folder in all_subdirs_of(self.path):
+            if folder == "Archive" or folder[0] in "._":
+                continue
+            stamp = self.parse_stamp(folder)
+            if stamp is None:
+                print(f'Could not interprete foldername: "{folder}" . Skiped folder')
+                continue
+            folders[folder] = [stamp, known[folder][1] if folder in known else self.folder_time(folder)]
+        return folders
+
+    def folder_time(self, folder):
+        'Best guess of the creation time of a folder that is not in the manifest'
+        stat = os.stat(os.path.join(self.path, folder))
+        return min(stat.st_mtime_ns, stat.st_ctime_ns)
+
+    def manifest_is_fresh(self):
+        try:
+            manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        return os.stat(self.path).st_mtime_ns < manifest_mtime
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return {}, []
+        if manifest.get("date_format") != self.date_format:
+            return {}, []
+        # Manifests of older versions only store the stamp
+        folders = {folder: value if isinstance(value, list) else [value, None]
+                   for folder, value in manifest.get("folders", {}).items()}
+        return folders, manifest.get("removed", [])
+
+    def load(self):
+        folders, self.removed = self.read_manifest()
+        if self.manifest_is_fresh() and folders and all(value[1] is not None for value in folders.values()):
+            self.folders = folders
+            return self.folders
+
+        known = {folder: value for folder, value in folders.items() if value[1] is not None}
+        self.folders = self.scan(known)
+        self.save()
+        return self.folders
+
+    def save(self):
+        os.makedirs(self.meta_path, exist_ok = True)
+        self.removed = self.removed[-MAX_REMOVED_NAMES:]
+        # Write in place, replacing the file would change the directory and invalidate the manifest
+        with open(self.manifest_path, 'w') as file:
+            json.dump({"date_format": self.date_format, "folders": self.folders, "removed": self.removed}, file)
+
+    def add(self, folder):
+        if self.folders is None:
+            self.load()
+        stamp = self.parse_stamp(folder)
+        if stamp is not None:
+            self.folders[folder] = [stamp, time.time_ns()]
+            self.save()
+
+    def reserved_names(self):
+        'Names of removed folders and of folders still in the trash, allocate_folder does not use them again'
+        if self.folders is None:
+            self.load()
+        names = set(self.removed)
+        if os.path.isdir(self.trash_path):
+            # Trashed folders are named <folder>.<pid>.<time_ns>
+            names.update(folder.rsplit(".", 2)[0] for folder in all_subdirs_of(self.trash_path))
+        return names
+
+    def prune(self, max_keep):
+        folders = self.load()
+
+        if len(folders) > max_keep:
+            # Oldest folders first, folders of the same second in the order they were created
+            n_remove = len(folders) - max_keep
+            remove = sorted(folders, key = lambda folder: (folders[folder][0], folders[folder][1], folder))[0:n_remove]
+            self.delete(remove)
+
+        self.purge_trash()
+
+    def delete(self, folders):
+        for folder in folders:
+            source = os.path.join(self.path, folder)
+            if self.async_delete:
+                os.makedirs(self.trash_path, exist_ok = True)
+                os.rename(source, os.path.join(self.trash_path, f"{folder}.{os.getpid()}.{time.time_ns()}"))
+            else:
+                remove_tree(source)
+            del self.folders[folder]
+            self.removed.append(folder)
+        self.save()
+        remove_from_index(os.path.join(self.path, folder) for folder in folders)
+
+    def purge_trash(self):
+        if not os.path.isdir(self.trash_path):
+            return None
+        trashed = [os.path.join(self.trash_path, folder) for folder in all_subdirs_of(self.trash_path)]
+        if not trashed:
+            return None
+        if not self.async_delete:
+            purge_folders(trashed)
+            return None
+
+        # Not a daemon thread, started deletions are finished before the interpreter exits
+        thread = threading.Thread(target = purge_folders, args = (trashed,), name = "sky-trash-purge")
+        thread.start()
+        return thread
+
+def purge_folders(folders):
+    for folder in folders:
+        try:
+            remove_tree(folder)
+        except OSError as error:
+            print(f'Could not delete "{folder}": {error}')
+
+def clear_readonly(function, path, _):
+    # Windows can not delete read-only files (linked snapshot objects), clear the flag and retry
+    shared_object = None
+    if os.path.isfile(path) and os.stat(path).st_nlink > 1:
+        shared_object = SnapshotStore().object_path(hash_file(path))
+    os.chmod(path, stat.S_IWRITE)
+    function(path)
+    # The flag belongs to the file, not to the link, the object linked by other runs is protected again
+    if shared_object is not None and os.path.exists(shared_object):
+        os.chmod(shared_object, 0o444)
+
+def remove_tree(path):
+    if sys.version_info >= (3, 12):
+        shutil.rmtree(path, onexc = clear_readonly)
+    else:
+        shutil.rmtree(path, onerror = clear_readonly)
+
+class FolderLock:
+    """ Lock file created with O_EXCL, usable as context manager
+
+    If the lock can not be acquired within timeout seconds, acquired stays False and the caller decides
+    whether to go on without it. Lock files older than stale seconds are left over from crashed runs
+    and are broken.
+    """
+    def __init__(self, lock_path, timeout = 30, stale = 600):
+        self.lock_path = lock_path
+        self.timeout = timeout
+        self.stale = stale
+        self.acquired = False
+
+    def acquire(self):
+        t_end = time.monotonic() + self.timeout
+        delay = 0.01
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                self.break_stale_lock()
+                if time.monotonic() > t_end:
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+                continue
+            with os.fdopen(fd, 'w') as file:
+                file.write(f"{os.getpid()} {time.time()}")
+            self.acquired = True
+            return True
+
+    def break_stale_lock(self):
+        try:
+            if time.time() - os.stat(self.lock_path).st_mtime > self.stale:
+                os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+    def release(self):
+        if self.acquired:
+            self.acquired = False
+            try:
+                os.remove(self.lock_path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+def unique_name(name, seq):
+    # First try the plain name, afterwards the microseconds of the current time as suffix
+    if seq == 0:
+        return name
+    return f"{name}_{time.time_ns() // 1000 % 1000000:06d}"
+
+def allocate_folder(path, name, max_tries = 1000, reserved = ()):
+    """ Creates the folder path/name atomically and returns its path
+
+    mkdir fails if the folder exists, in that case the microseconds are appended to the name
+    (name_123456), so runs started in the same second never share a folder. Names in reserved (the
+    removed folders, see RetentionManager.reserved_names) are not handed out again.
+    """
+    os.makedirs(path, exist_ok = True)
+    for seq in range(max_tries):
+        folder_name = unique_name(name, seq)
+        if folder_name in reserved:
+            continue
+        folder_path = os.path.join(path, folder_name)
+        try:
+            os.mkdir(folder_path)
+        except FileExistsError:
+            continue
+        return folder_path
+    raise FileExistsError(f'Could not allocate a folder for "{name}" in "{path}"')
+
+def allocate_file(path, name, extension, max_tries = 1000):
+    """ Reserves path/name.extension with O_EXCL and returns the unique name without extension """
+    for seq in range(max_tries):
+        file_name = unique_name(name, seq)
+        try:
+            fd = os.open(os.path.join(path, file_name + "." + extension), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return file_name
+    raise FileExistsError(f'Could not allocate a file for "{name}.{extension}" in "{path}"')
 
 def create_result_folder(tag = "", max_res_folders = None, max_daily_folders = None, archive = False):
 
@@ -28,8 +304,8 @@ def create_result_folder(tag = "", max_res_folders = None, max_daily_folders = N
     isExist = os.path.exists(path)
     
     if not isExist:
-        # Create a new directory because it does not exist
-        os.makedirs(path)
+        # Create a new directory because it does not exist, parallel runs may do the same
+        os.makedirs(path, exist_ok = True)
         print("The new directory is created!")
 
     # Keep only last 7 daily result folders
@@ -41,57 +317,169 @@ def create_result_folder(tag = "", max_res_folders = None, max_daily_folders = N
     # Output Folder
     now = datetime.now()
     time_string = now.strftime("%H_%M_%S")
-    target_folder_path = path + '/' + time_string + "_" + tag 
+    folder_name = time_string + "_" + tag
 
-    # Remove Output folders greater than 
-    if not archive:
-        if max_res_folders is not None:
-            date_format = '%H_%M_%S'
-            remove_folders(path, max_res_folders, date_format)
+    if archive or max_res_folders is None:
+        target_folder_path = allocate_folder(path, folder_name)
+        index_run(target_folder_path, tag)
+        return target_folder_path
+
+    # Remove Output folders greater than, the lock is held until the new folder is in the manifest
+    date_format = '%H_%M_%S'
+    retention = RetentionManager(path, date_format)
+    with retention.lock() as lock:
+        if lock.acquired:
+            retention.prune(max_res_folders)
+        else:
+            print(f'Could not lock "{path}". Skiped removing old folders')
 
-    # Create target folder
-    os.makedirs(target_folder_path)
+        # Create target folder
+        target_folder_path = allocate_folder(path, folder_name, reserved = retention.reserved_names())
+        if lock.acquired:
+            retention.add(os.path.basename(target_folder_path))
+
+        # Indexed while the lock is held, a parallel run can not prune the folder before it is in the index
+        index_run(target_folder_path, tag)
 
     return target_folder_path
 
-def remove_folders(path, max_keep, date_format):
-    
-        folders = all_subdirs_of(path)
-        date_obj = []
-        if date_format == '%Y-%m-%d':
-            max_idx = 10
-        elif date_format == '%H_%M_%S':
-            max_idx = 8
-
-        for day_folder in folders:
-            
+def index_run(folder, tag):
+    try:
+        RunIndex().add_run(folder, tag)
+    except sqlite3.Error as error:
+        print(f'Could not record run in index: {error}')
+
+def remove_folders(path, max_keep, date_format, async_delete = True):
+
+    retention = RetentionManager(path, date_format, async_delete = async_delete)
+    with retention.lock() as lock:
+        if lock.acquired:
+            retention.prune(max_keep)
+        else:
+            print(f'Could not lock "{path}". Skiped removing old folders')
+
+    return retention
+
+class SnapshotStore:
+    """ Content addressed store for the files belonging to a run
+
+    Every file is stored once under objects/<hash[:2]>/<hash>. A run folder gets a hard link to the stored
+    object ("link") or only an entry in its snapshot.json ("manifest"). All recorded files are appended to
+    index.jsonl, so runs can be looked up by the hash of a script, config or package version. The objects
+    are read-only, a linked file edited in one run would change the object shared by all runs.
+    """
+    def __init__(self, root = SNAPSHOT_ROOT):
+        self.root = root
+        self.objects_path = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.jsonl")
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_path, digest[0:2], digest)
+
+    def store(self, filepath):
+        digest = hash_file(filepath)
+        target = self.object_path(digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok = True)
+            # Copy under a temporary name, parallel runs storing the same file replace it atomically
+            tmp_file = f"{target}.{os.getpid()}.tmp"
+            shutil.copyfile(filepath, tmp_file)
+            os.chmod(tmp_file, 0o444)
+            os.replace(tmp_file, target)
+        return digest
+
+    def store_bytes(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.object_path(digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok = True)
+            tmp_file = f"{target}.{os.getpid()}.tmp"
+            with open(tmp_file, 'wb') as file:
+                file.write(data)
+            os.chmod(tmp_file, 0o444)
+            os.replace(tmp_file, target)
+        return digest
+
+    def store_package(self, package_path = None):
+        'Stores all python files of a package, returns the hash of its file tree'
+        if package_path is None:
+            package_path = os.path.dirname(os.path.abspath(__file__))
+
+        tree = {}
+        for dirpath, dirnames, filenames in os.walk(package_path):
+            dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+            for filename in sorted(filenames):
+                if filename.endswith(".py"):
+                    filepath = os.path.join(dirpath, filename)
+                    tree[os.path.relpath(filepath, package_path).replace(os.sep, "/")] = self.store(filepath)
+
+        return self.store_bytes(json.dumps(tree, sort_keys = True).encode())
+
+    def add_to_run(self, filepath, run_folder, target_name, mode = "link"):
+        digest = self.store(filepath)
+        if mode == "link":
+            target_file = os.path.join(run_folder, target_name)
             try:
-                date_obj.append(datetime.strptime(day_folder[0:max_idx], date_format))
-            except ValueError:
-                if day_folder != "Archive":
-                    print(f'Could not interprete foldername: "{day_folder}" . Skiped folder')
+                os.link(self.object_path(digest), target_file)
+            except OSError:
+                # No hard links on this file system or across devices
+                shutil.copy(filepath, target_file)
+        elif mode != "manifest":
+            raise ValueError(f'Unknown snapshot mode "{mode}". Use "link" or "manifest"')
 
-        remove_staps = []
+        self.record(run_folder, {target_name: digest})
+        return digest
 
-        if len(date_obj) > max_keep:
-            n_remove = len(date_obj) - max_keep
-            date_obj.sort()
+    def record(self, run_folder, entries):
+        manifest_file = os.path.join(run_folder, "snapshot.json")
+        manifest = {}
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'r') as file:
+                manifest = json.load(file)
+        manifest.update(entries)
+        with open(manifest_file, 'w') as file:
+            json.dump(manifest, file, indent = 1)
 
-            for i in range(n_remove):
-                remove_staps.append(date_obj[i].strftime(date_format))
+        os.makedirs(self.root, exist_ok = True)
+        lines = "".join(json.dumps({"run": run_folder, "name": name, "digest": digest}) + "\n"
+                        for name, digest in entries.items())
+        with open(self.index_path, 'a') as file:
+            file.write(lines)
 
-            for day_folder in folders:
-                for remove_stap in remove_staps:
-                    if day_folder[0:max_idx] == remove_stap:
-                        shutil.rmtree(path + "/" + day_folder)
+    def find_runs(self, digest):
+        'Returns the run folders that used the file or package with the given hash'
+        if not os.path.exists(self.index_path):
+            return []
+        runs = []
+        with open(self.index_path, 'r') as file:
+            for line in file:
+                entry = json.loads(line)
+                if entry["digest"] == digest and entry["run"] not in runs:
+                    runs.append(entry["run"])
+        return runs
 
-def save_script(filepath, tag = "", max_daily_folders = None, max_res_folders = None, archive = False):
+def hash_file(filepath, chunk_size = 1 << 20):
+    file_hash = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+def save_script(filepath, tag = "", max_daily_folders = None, max_res_folders = None, archive = False, snapshot = None, snapshot_package = False):
     target_folder_path = create_result_folder(tag, max_res_folders, max_daily_folders, archive)
 
     # Create target file
-    target_file = target_folder_path + "/executed_file_" + tag + ".py"
+    target_name = "executed_file_" + tag + ".py"
 
-    # Copy script
-    shutil.copy(filepath, target_file)
+    if snapshot is None:
+        # Copy script
+        shutil.copy(filepath, target_folder_path + "/" + target_name)
+    else:
+        # Store script (and package) once, link it into the result folder
+        store = SnapshotStore()
+        digest = store.add_to_run(filepath, target_folder_path, target_name, mode = snapshot)
+        record_run(target_folder_path, script_hash = digest)
+        if snapshot_package:
+            store.record(target_folder_path, {"package": store.store_package()})
 
-    return target_folder_path
\ No newline at end of file
+    return target_folder_path
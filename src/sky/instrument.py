@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# Opt-in timing and memory instrumentation. Plotter.plot, Plotter.save_plot, create_plotfile and
+# latex_graphic_export emit spans for their stages (figure creation, drawing, layout, savefig, pickling,
+# Inkscape, ...). Without enable() a span costs one check of a global.
+#
+#   instrumentation = enable(logger = init_logger(save_dir, "log"), jsonl_path = save_dir + "/spans.jsonl")
+#   ... plots ...
+#   print(instrumentation.report())
+#   disable()
+
+active = None
+
+class Instrumentation:
+    """ Collects spans with wall time, CPU time and the tracemalloc peak (relative to the start of the span)
+
+    Every finished span is written as one JSON line to jsonl_path and/or logged to logger.
+    """
+    def __init__(self, logger = None, jsonl_path = None, trace_memory = True):
+        if isinstance(logger, str):
+            logger = logging.getLogger(logger)
+        self.logger = logger
+        self.jsonl_path = jsonl_path
+        self.trace_memory = trace_memory
+        self.started_tracemalloc = False
+        self.records = []
+        self.ids = itertools.count(1)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        return self
+
+    def stop(self):
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    @contextmanager
+    def span(self, name, **fields):
+        stack = self.stack()
+        parent = stack[-1] if stack else None
+
+        record = {"name": name, "id": next(self.ids), "parent": parent["id"] if parent else None}
+        # The figure name is inherited from the enclosing span
+        if parent is not None and "figure" in parent:
+            record["figure"] = parent["figure"]
+        record.update(fields)
+
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if parent is not None:
+                parent["_peak"] = max(parent["_peak"], peak)
+            tracemalloc.reset_peak()
+            record["_start_memory"] = current
+            record["_peak"] = current
+
+        stack.append(record)
+        record["start"] = time.time()
+        t_wall = time.perf_counter()
+        t_cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall"] = time.perf_counter() - t_wall
+            record["cpu"] = time.process_time() - t_cpu
+            stack.pop()
+
+            if tracing:
+                peak = max(record.pop("_peak"), tracemalloc.get_traced_memory()[1])
+                record["peak_memory"] = peak - record.pop("_start_memory")
+                if parent is not None:
+                    parent["_peak"] = max(parent["_peak"], peak)
+
+            self.emit(record)
+
+    def emit(self, record):
+        record = dict(record)
+        record["pid"] = os.getpid()
+        with self.lock:
+            self.records.append(record)
+            if self.jsonl_path is not None:
+                with open(self.jsonl_path, 'a') as file:
+                    file.write(json.dumps(record, default = str) + "\n")
+
+        if self.logger is not None:
+            memory = f", peak {record['peak_memory'] / 2**20:.2f} MiB" if "peak_memory" in record else ""
+            self.logger.info(f"Span {record['name']} ({record.get('figure', '-')}): wall {record['wall']:.4f} s, "
+                             f"cpu {record['cpu']:.4f} s{memory}", extra = {"span": record})
+
+    def report(self, n = 10):
+        return create_report(self.records, n)
+
+def enable(logger = None, jsonl_path = None, trace_memory = True):
+    'Starts collecting spans, logger is a logging.Logger (e.g. from init_logger) or its name'
+    global active
+    disable()
+    active = Instrumentation(logger = logger, jsonl_path = jsonl_path, trace_memory = trace_memory).start()
+    return active
+
+def disable():
+    global active
+    if active is not None:
+        active.stop()
+    active = None
+
+@contextmanager
+def span(name, **fields):
+    'Measures the enclosed block if the instrumentation is enabled, yields the span record or None'
+    if active is None:
+        yield None
+        return
+    with active.span(name, **fields) as record:
+        yield record
+
+def load_records(jsonl_path):
+    with open(jsonl_path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def create_report(records, n = 10):
+    'Table of the n slowest figures (top level "plot" spans) with the time of their stages'
+    figures = [record for record in records if record["name"] == "plot"]
+    figures = sorted(figures, key = lambda record: record["wall"], reverse = True)[0:n]
+
+    stages = {}
+    for record in records:
+        if record["parent"] is not None:
+            stages.setdefault((record.get("pid"), record["parent"]), []).append(record)
+
+    lines = [f"Slowest {len(figures)} of {sum(record['name'] == 'plot' for record in records)} figures"]
+    for record in figures:
+        memory = f", peak {record['peak_memory'] / 2**20:8.2f} MiB" if "peak_memory" in record else ""
+        lines.append(f"{record['wall']:8.3f} s (cpu {record['cpu']:8.3f} s{memory})  {record.get('figure', '-')}")
+        for stage in collect_stages(stages, record):
+            lines.append(f"    {stage['wall']:8.3f} s  {'  ' * stage['depth']}{stage['name']}")
+
+    return "\n".join(lines)
+
+def collect_stages(stages, record, depth = 0):
+    result = []
+    for stage in sorted(stages.get((record.get("pid"), record["id"]), []), key = lambda stage: stage["start"]):
+        result.append(dict(stage, depth = depth))
+        result.extend(collect_stages(stages, stage, depth + 1))
+    return result
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Report of the slowest figures of a spans file')
+    parser.add_argument('jsonl_path', help = 'JSON lines file written by sky.instrument')
+    parser.add_argument('-n', default = 10, type = int, help = 'number of figures')
+    args = parser.parse_args(argv)
+    print(create_report(load_records(args.jsonl_path), args.n))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+import importlib
+import types
+
+class LazyModule(types.ModuleType):
+    """ Stand-in for a module which is only imported on first attribute access
+
+        plt = lazy_import("matplotlib.pyplot")    --> nothing is imported yet
+        plt.figure()                             --> imports matplotlib.pyplot
+    """
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __dir__(self):
+        return dir(self.load())
+
+def lazy_import(name):
+    return LazyModule(name)
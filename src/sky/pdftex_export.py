@@ -1,4 +1,5 @@
-import os, re
+import os, itertools
+from sky.instrument import span
 
 # from toolbox.translationRules import translation_rules, si_rules
 
@@ -53,13 +54,23 @@ si_rules = [[r' dB',         r' \Si{}{\decibel}'],
 
 
 
-def check_translation_rules(string, start, stop, use_si=False):
+def create_translation_lookup(rules):
+    """ Maps each placeholder to its first matching rule, so a lookup replaces the scan over all rules """
+    lookup = {}
+    for rule in rules:
+        lookup.setdefault(rule[0], rule[1])
+    return lookup
+
+def check_translation_rules(string, start, stop, use_si=False, lookup=None):
 
     global translation_rules, si_rules
 
     adjusted_string = string[:]
     cont = string[start:stop]
-    cont = [rule[1] for gg, rule in enumerate(translation_rules) if cont == rule[0]]
+    if lookup is not None:
+        cont = [lookup[cont]] if cont in lookup else []
+    else:
+        cont = [rule[1] for gg, rule in enumerate(translation_rules) if cont == rule[0]]
     if cont:
         if use_si:
             cont_si = [cont[0].replace(rule[0], rule[1]) for gg, rule in enumerate(si_rules) if rule[0] in cont[0]]
@@ -68,6 +79,97 @@ def check_translation_rules(string, start, stop, use_si=False):
         adjusted_string = string[:start] + cont[0] + string[stop:]
     return adjusted_string
 
+def split_put_text(line):
+    """ Returns the (start, stop) slice of the text inside a pdf_tex ``\\put`` line or None if there is none """
+    for align in ('{l}', '{c}', '{r}'):
+        start = line.find(align)
+        if start >= 0:
+            start = start + 3
+            stop = line.find(r'\end', start)
+            if stop >= 0:
+                return start, stop
+    return None
+
+def transform_pdf_tex(source,
+                      target,
+                      graphic_name='LatexFigure',
+                      pdf_tex_dir=r'./pics/',
+                      insert_hints=False,
+                      use_replacing_rules=False,
+                      use_si_pack=False):
+
+    """ Streaming pdf_tex post-processor
+
+    Reads the pdf_tex file written by Inkscape line by line and writes the adjusted tex file incrementally.
+    The header hints (leading comment lines) are dropped unless insert_hints is set. Within the block of
+    \\put lines the order is: included pdf pages, numeric labels (sorted by length), text labels
+    (sorted by length). Only the \\put lines are held in memory, everything else is passed straight through.
+
+        source = 'LatexFigure.pdf_tex',              --> pdf_tex file written by Inkscape
+        target = 'LatexFigure.tex',                  --> adjusted tex file
+        graphic_name = 'LatexFigure',                --> Name of the file
+        pdf_tex_dir = r'./pictures/'                 --> name of your picture directory in Latex structure
+    """
+    pdf_name = f'{graphic_name}.pdf'
+    lookup = create_translation_lookup(translation_rules)
+
+    pdf_including = []
+    num_including = []
+    tex_including = []
+    # Lines without \put after the first \put line, stored with the number of \put lines in front of them
+    passed_including = []
+    n_put = 0
+
+    in_header = not insert_hints
+    with open(source, 'r') as src, open(target, 'w') as dst:
+        for content in src:
+
+            # ============== Skip the Inkscape hints in front of the picture ===========================================
+            if in_header:
+                if content.startswith('%') or not content.strip():
+                    continue
+                in_header = False
+
+            if r'\put(' not in content:
+                if n_put == 0:
+                    dst.write(content)
+                else:
+                    passed_including.append((n_put, content))
+                continue
+
+            n_put += 1
+            if pdf_name in content:
+                pdf_including.append(content.replace(pdf_name, f'{pdf_tex_dir}{pdf_name}', 1))
+                continue
+
+            text_slice = split_put_text(content)
+            if text_slice is None:
+                tex_including.append(content)
+                continue
+
+            start, stop = text_slice
+            if content[start:stop].replace(".", "", 1).isdigit():
+                num_including.append(content)
+            else:
+                if use_replacing_rules:
+                    content = check_translation_rules(string=content, start=start, stop=stop, use_si=use_si_pack,
+                                                      lookup=lookup)
+                tex_including.append(content)
+
+        # ============== Write the sorted put block and the remaining lines =============================================
+        idx_passed = 0
+        ordered = itertools.chain(pdf_including, sorted(num_including, key=len), sorted(tex_including, key=len))
+        for idx_put, content in enumerate(ordered):
+            while idx_passed < len(passed_including) and passed_including[idx_passed][0] == idx_put:
+                dst.write(passed_including[idx_passed][1])
+                idx_passed += 1
+            dst.write(content)
+
+        for _, content in passed_including[idx_passed:]:
+            dst.write(content)
+
+    return target
+
 def latex_graphic_export(figure,
                          graphic_name='LatexFigure',
                          file_path=os.getcwd(),
@@ -101,11 +203,12 @@ def latex_graphic_export(figure,
     if len(file_path) == 0 or file_path[0] in ['.', ' ']:
         file_path = os.path.join(os.getcwd())
     pdf_file = os.path.join(file_path, graphic_name)
-    for fm in [pdf_file, pdf_file+'Control']:
-        figure.savefig(fr'{fm}.pdf',
-                       bbox_inches='tight',
-                       pad_inches=0.0,
-                       transparent=True)
+    with span("savefig", format="pdf"):
+        for fm in [pdf_file, pdf_file+'Control']:
+            figure.savefig(fr'{fm}.pdf',
+                           bbox_inches='tight',
+                           pad_inches=0.0,
+                           transparent=True)
 
     # ============== Existing data with the same name will be removed ==================================================
     if os.path.exists(fr'{pdf_file}.pdf_tex'):
@@ -113,63 +216,26 @@ def latex_graphic_export(figure,
 
     # ============== Try command for Inkscape < 1.0 ====================================================================
     os.chdir(ink_dir)
-    command = f'.\inkscape {pdf_file}.pdf --export-pdf={pdf_file}.pdf --export-latex'
-    os.system(fr'cmd /c {command}')
-
-    # ============== If no pdf_tex file was created, try command for Inkscape >= 1.0 ===================================
-    if os.path.exists(fr'{pdf_file}.pdf_tex') is False:
-        command = f'.\inkscape {pdf_file}.pdf --export-filename={pdf_file}.pdf --export-latex'
+    with span("inkscape"):
+        command = f'.\inkscape {pdf_file}.pdf --export-pdf={pdf_file}.pdf --export-latex'
         os.system(fr'cmd /c {command}')
 
-    # ============== Read in the pdf_tex file and store contents into new variable =====================================
-    os.chdir(file_path)
-    file = open('{}.pdf_tex'.format(graphic_name), 'r')
-    contents = file.readlines()
-    file.close()
-
-    # ============== Change the relevant paths in the pdf_tex file =====================================================
-    if insert_hints is False:
-        contents = contents[26:]
+        # ============== If no pdf_tex file was created, try command for Inkscape >= 1.0 ===============================
+        if os.path.exists(fr'{pdf_file}.pdf_tex') is False:
+            command = f'.\inkscape {pdf_file}.pdf --export-filename={pdf_file}.pdf --export-latex'
+            os.system(fr'cmd /c {command}')
 
-    pdf_including = []
-    tex_including = []
-    num_including = []
-    idx_including = []
-
-    idx_start_insert = 0
-    for ii, content in enumerate(contents):
-        check = re.search(r'put', content)
-        if check is not None:
-            if idx_start_insert == 0:
-                idx_start_insert = ii
-            check = re.search(fr'{graphic_name}.pdf', content)
-            if check is not None:
-                value = check.string[0:check.start()] + f'{pdf_tex_dir}{graphic_name}.pdf' + check.string[check.end():]
-                pdf_including.append(value)
-                contents[ii] = value
-            else:
-                start = content.index('{l}') + 3
-                stop = content.index(r'\end')
-                if content[start:stop].replace(".", "", 1).isdigit():
-                    num_including.append(content)
-                else:
-                    if use_replacing_rules:
-                        # if any(x in content[start:stop] for x in ["\\", r"_"]):
-                        #     content = content[:start] + "$" + content[start:stop] + "$" + content[stop:]
-                        content = check_translation_rules(string=content, start=start, stop=stop, use_si=use_si_pack)
-                    tex_including.append(content)
-            idx_including.append(ii)
-
-    for idx, content in zip(idx_including,
-                            pdf_including + sorted(num_including, key=len) + sorted(tex_including, key=len)):
-        contents[idx] = content
-
-    # ============== Save a new pdf_tex file ===========================================================================
+    # ============== Change the relevant paths in the pdf_tex file and save it as tex file ===========================
+    os.chdir(file_path)
     if stay_tex is False:
-        file = open('{}.tex'.format(graphic_name), 'w')
-        contents = "".join(contents)
-        file.write(contents)
-        file.close()
+        with span("transform_pdf_tex"):
+            transform_pdf_tex(fr'{pdf_file}.pdf_tex',
+                              os.path.join(file_path, f'{graphic_name}.tex'),
+                              graphic_name=graphic_name,
+                              pdf_tex_dir=pdf_tex_dir,
+                              insert_hints=insert_hints,
+                              use_replacing_rules=use_replacing_rules,
+                              use_si_pack=use_si_pack)
 
     if os.path.exists(fr'{pdf_file}.pdf_tex'):
         os.remove(fr'{pdf_file}.pdf_tex')
@@ -1,13 +1,59 @@
 import os
-import pickle, vtk
-import seaborn as sns
+import json
+import pickle
 from datetime import datetime
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle, Polygon
-from matplotlib.tri import Triangulation
 from collections.abc import Iterable 
-from sky.pdftex_export import latex_graphic_export
+from sky.lazyimport import lazy_import
+from sky.filemanager import allocate_file
+from sky.datastructures import StreamingHistogram, TriMesh
+from sky.runindex import record_run
+from sky.instrument import span
+
+# matplotlib is imported on first use, creating plot objects only needs matplotlib itself
+mpl = lazy_import("matplotlib")
+plt = lazy_import("matplotlib.pyplot")
+patches = lazy_import("matplotlib.patches")
+mcoll = lazy_import("matplotlib.collections")
+mcolors = lazy_import("matplotlib.colors")
+
+def get_default_colors():
+    'Colors of the current style, read when a plot is drawn and not when it is created'
+    return mpl.rcParams['axes.prop_cycle'].by_key()['color']
+
+def despine(ax, offset = None, top = True, right = True, left = False, bottom = False):
+    """ Removes the selected spines and moves the remaining ones outward by offset points
+
+    Same behaviour as seaborn.despine(ax = ax, ...) without trim, offset is a number or a dict per side.
+    """
+    remove = {"top": top, "right": right, "left": left, "bottom": bottom}
+
+    for side, spine in ax.spines.items():
+        if side not in remove:
+            continue
+        is_visible = not remove[side]
+        spine.set_visible(is_visible)
+        if offset is not None and is_visible:
+            val = offset.get(side, 0) if isinstance(offset, dict) else offset
+            spine.set_position(('outward', val))
+
+    # Move the ticks to the remaining spine
+    if left and not right:
+        move_ticks(ax.yaxis, "right")
+
+    if bottom and not top:
+        move_ticks(ax.xaxis, "top")
+
+    return ax
+
+def move_ticks(axis, position):
+    maj_on = any(t.tick1line.get_visible() for t in axis.majorTicks)
+    min_on = any(t.tick1line.get_visible() for t in axis.minorTicks)
+    axis.set_ticks_position(position)
+    for t in axis.majorTicks:
+        t.tick2line.set_visible(maj_on)
+    for t in axis.minorTicks:
+        t.tick2line.set_visible(min_on)
 
 class Axes2D:
     def __init__(self, x_label = "x", y_label = "f(x)") -> None:
@@ -54,54 +100,110 @@ class Axes2D:
         self.rm_left_frame = rm_left
         self.rm_right_frame = rm_right
 
-    def set_2D_ax_properties(self, ax):
-        
-        ax.set_xscale(self.x_scale)
-        if self.xlim[0] is not None or self.xlim[1] is not None:
-            ax.set_xlim(left = self.xlim[0], right = self.xlim[1])
-        
-        ax.set_yscale(self.y_scale)
-        if self.ylim[0] is not None or self.ylim[1] is not None:
-            ax.set_ylim(bottom = self.ylim[0], top = self.ylim[1])
-
-        ax.grid(self.plot_grid)
-
-        ax.set_title(self.title)
-               
-        if self.draw_xlabel:
-            ax.set_xlabel(self.x_label)
-        else:
-            ax.set_xlabel("")
+    def plot(self, ax):
+        ax = self.draw(ax)
+        ax = self.set_2D_ax_properties(ax)
 
-        if self.draw_ylabel:
-            ax.set_ylabel(self.y_label)
-        else:
-            ax.set_ylabel("")
+        return ax
 
-        if self.x_ticks is not None:
-            ax.set_xticks(self.x_ticks)
+    def ax_properties(self):
+        'Axis settings of this plot, merged with the other plots of a subplot by merge_ax_properties'
 
-        if self.y_ticks is not None:
-            ax.set_yticks(self.y_ticks)
-        
+        tick_params = {}
         if self.draw_xticks is not None:
-            ax.tick_params(bottom = self.draw_xticks)
+            tick_params["bottom"] = self.draw_xticks
 
         if self.draw_yticks is not None:
-            ax.tick_params(left = self.draw_yticks, right = self.draw_yticks)
-        
+            tick_params["left"] = self.draw_yticks
+            tick_params["right"] = self.draw_yticks
+
         if self.draw_xticklabels is not None:
-            ax.tick_params(labelbottom = self.draw_xticklabels)
+            tick_params["labelbottom"] = self.draw_xticklabels
 
         if self.draw_yticklabels is not None:
-            ax.tick_params(labelleft = self.draw_yticklabels, labelright = self.draw_yticklabels)
+            tick_params["labelleft"] = self.draw_yticklabels
+            tick_params["labelright"] = self.draw_yticklabels
+
+        return {"xscale": self.x_scale,
+                "yscale": self.y_scale,
+                "xlim": list(self.xlim),
+                "ylim": list(self.ylim),
+                "grid": self.plot_grid,
+                "title": self.title,
+                "xlabel": self.x_label if self.draw_xlabel else "",
+                "ylabel": self.y_label if self.draw_ylabel else "",
+                "xticks": self.x_ticks,
+                "yticks": self.y_ticks,
+                "tick_params": tick_params,
+                "despine": dict(offset = self.frame_offset, bottom = self.rm_bottom_frame, left = self.rm_left_frame,
+                                top = self.rm_top_frame, right = self.rm_right_frame),
+                "axis_equal": self.axis_equal}
 
-        sns.despine(ax=ax, offset=self.frame_offset, bottom = self.rm_bottom_frame, left = self.rm_left_frame, top = self.rm_top_frame, right = self.rm_right_frame)
+    def set_2D_ax_properties(self, ax):
 
-        if self.axis_equal:
-            ax.axis('equal')
+        return apply_ax_properties(ax, self.ax_properties())
 
-        return ax
+def merge_ax_properties(plots):
+    """ Merges the axis settings of all plots in one subplot
+
+    Equal to applying them one after another: the last plot wins, limits and ticks of earlier plots stay
+    if a later plot does not set them.
+    """
+    merged = None
+    for plot_item in plots:
+        props = plot_item.ax_properties()
+        if merged is None:
+            merged = props
+            continue
+
+        for key in ["xlim", "ylim"]:
+            merged[key] = [new if new is not None else old for old, new in zip(merged[key], props[key])]
+        for key in ["xticks", "yticks"]:
+            if props[key] is not None:
+                merged[key] = props[key]
+        merged["tick_params"].update(props["tick_params"])
+        merged["axis_equal"] = merged["axis_equal"] or props["axis_equal"]
+
+        for key in ["xscale", "yscale", "grid", "title", "xlabel", "ylabel", "despine"]:
+            merged[key] = props[key]
+
+    return merged
+
+def apply_ax_properties(ax, props):
+    'Applies merged axis settings with one ax.set and one tick_params call'
+
+    # Setting the scale is expensive and repeats for every shared axis, skip it if nothing changes
+    ax_kwargs = {}
+    if ax.get_xscale() != props["xscale"]:
+        ax_kwargs["xscale"] = props["xscale"]
+    if ax.get_yscale() != props["yscale"]:
+        ax_kwargs["yscale"] = props["yscale"]
+    if props["xlim"][0] is not None or props["xlim"][1] is not None:
+        ax_kwargs["xlim"] = props["xlim"]
+    if props["ylim"][0] is not None or props["ylim"][1] is not None:
+        ax_kwargs["ylim"] = props["ylim"]
+
+    ax_kwargs["title"] = props["title"]
+    ax_kwargs["xlabel"] = props["xlabel"]
+    ax_kwargs["ylabel"] = props["ylabel"]
+
+    if props["xticks"] is not None:
+        ax_kwargs["xticks"] = props["xticks"]
+    if props["yticks"] is not None:
+        ax_kwargs["yticks"] = props["yticks"]
+
+    ax.set(**ax_kwargs)
+    ax.grid(props["grid"])
+
+    if props["tick_params"]:
+        ax.tick_params(**props["tick_params"])
+
+    despine(ax, **props["despine"])
+
+    if props["axis_equal"]:
+        ax.axis('equal')
+
+    return ax
 
 class LinePlot(Axes2D):
     def __init__(self, x, y, x_label = "x", y_label = "f(x)", **kwargs):
@@ -114,7 +216,7 @@ class LinePlot(Axes2D):
         self.linewidth = 2.0
         self.linestyle = '-'
         self.color_no = None
-        self.default_colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        self.default_colors = None
 
         # Set custom Plot Style
         self.set_default_line_kwargs()
@@ -136,19 +238,73 @@ class LinePlot(Axes2D):
 
         self.y = np.concatenate([self.y, y], axis = 1) 
 
-    def plot(self, ax):
+    def draw(self, ax):
         self.set_default_line_kwargs()
 
         if self.color_no is not None:
-            self.kwargs["color"] = self.default_colors[self.color_no]
+            colors = self.default_colors if self.default_colors is not None else get_default_colors()
+            self.kwargs["color"] = colors[self.color_no]
 
         ax.plot(self.x, self.y, **self.kwargs)
         
-        ax = self.set_2D_ax_properties(ax)
+
+        return ax
+
+class LineCollectionPlot(Axes2D):
+    """ Draws all columns of y (n_x x n_lines) over x as one LineCollection
+
+    Much faster than one line per column for many lines. The lines cycle through the default colors
+    or are colored by color_values (one value per line) with cmap.
+    """
+    def __init__(self, x, y, x_label = "x", y_label = "f(x)", color_values = None, **kwargs):
+        super().__init__(x_label, y_label)
+        self.x = x
+        self.y = y
+        self.color_values = color_values
+        self.kwargs = kwargs
+
+        # Default line properties
+        self.linewidth = 2.0
+        self.linestyle = '-'
+        self.default_colors = None
+        self.cmap = "viridis"
+        self.cbar = False
+        self.cbar_label = ""
+
+    def draw(self, ax):
+        x = np.asarray(self.x)
+        y = np.asarray(self.y).reshape(x.size, -1)
+
+        # n_lines x n_x x 2
+        segments = np.empty((y.shape[1], x.size, 2))
+        segments[:, :, 0] = x
+        segments[:, :, 1] = y.T
+
+        kwargs = {"linewidths": self.linewidth, "linestyles": self.linestyle}
+        if self.color_values is not None:
+            kwargs["array"] = np.asarray(self.color_values)
+            kwargs["cmap"] = self.cmap
+        else:
+            kwargs["colors"] = self.default_colors if self.default_colors is not None else get_default_colors()
+        kwargs.update(self.kwargs)
+
+        lines = mcoll.LineCollection(segments, **kwargs)
+        ax.add_collection(lines)
+        ax.autoscale_view()
+
+        if self.cbar and self.color_values is not None:
+            cbar = plt.colorbar(lines, ax = ax)
+            cbar.set_label(self.cbar_label)
 
         return ax
 
 class HistPlot(Axes2D):
+    """ Histogram of y, drawn with ax.hist
+
+    y can also be a StreamingHistogram (counts accumulated out of core, see datastructures) or a memmap,
+    which is histogrammed chunk by chunk. Their counts are drawn with ax.stairs, only the counts are
+    pickled with the plot data.
+    """
     def __init__(self, y, x_label = 'x', y_label = 'f(x)', **hist_kwarg):
         super().__init__(x_label, y_label)
         self.y = y
@@ -171,66 +327,151 @@ class HistPlot(Axes2D):
         if 'density' not in self.hist_kwarg:
             self.hist_kwarg["density"] = self.density
 
-    def plot(self, ax):
+    def draw(self, ax):
         self.set_default_hist_kwargs()
 
-        ax.hist(self.y, **self.hist_kwarg)
-        
-        ax = self.set_2D_ax_properties(ax)
+        if isinstance(self.y, np.memmap):
+            bins = self.hist_kwarg["bins"] if self.hist_kwarg["bins"] is not None else 10
+            self.y = StreamingHistogram.from_data(self.y, bins = bins, range = self.hist_kwarg.get("range"))
 
-        return ax
-    
-class vectorFieldPlot():
-    def __init__(self, x, y, dx, dy, **vec_kwarg):
-        self.x = x
-        self.y = y
-        self.dx = dx
-        self.dy = dy
-        self.line_kwargs = vec_kwarg
+        if isinstance(self.y, StreamingHistogram):
+            self.draw_counts(ax)
+        else:
+            ax.hist(self.y, **self.hist_kwarg)
 
-        # Default ax properties
-        self.x_label = "x"
-        self.x_scale = 'linear'
-        self.draw_xticks = True
-        self.draw_xlabel = True
+        return ax
 
-        self.y_label = "f(x)"
-        self.y_scale = 'linear'
-        self.draw_yticks = True
-        self.draw_ylabel = True
+    def draw_counts(self, ax):
+        hist = self.y.finalize()
+        values = hist.density() if self.hist_kwarg["density"] else hist.counts
 
-        self.plot_grid = True
-        self.title = ''
-        self.legend = []
+        unsupported = [key for key in ["cumulative", "weights", "stacked", "log"] if self.hist_kwarg.get(key)]
+        if len(unsupported) > 0:
+            raise ValueError(f"The hist arguments {unsupported} are not supported for a StreamingHistogram or memmap")
 
-        # Default line properties
-        self.linewidth = 2.0
-        self.linestyle = '-'
-        self.color_no = None
-        self.default_colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
-
-        # Set custom Plot Style
-        self.set_default_line_kwargs()
-        
-    def set_default_line_kwargs(self):
+        # ax.stairs only takes the patch properties, histtype "step" draws the outline only
+        stairs_kwargs = {key: value for key, value in self.hist_kwarg.items()
+                         if key not in ["bins", "density", "range", "histtype", "rwidth", "align", "cumulative",
+                                        "weights", "stacked", "log"]}
+        stairs_kwargs.setdefault("fill", self.hist_kwarg.get("histtype", "bar") != "step")
+        ax.stairs(values, hist.edges, **stairs_kwargs)
+    
+class vectorFieldPlot(Axes2D):
+    """ Vector field (dx, dy) at the points x, y drawn as arrows (quiver) or streamlines
+
+    x, y, dx, dy are 2D arrays of a structured grid (e.g. np.meshgrid) or 1D arrays of scattered points;
+    from_grid and from_grid_data take the field on a sky Grid. Dense fields are subsampled to
+    arrows_per_inch arrows per inch of the axis (strides on grids, one arrow per cell for scattered
+    points), so the number of arrows does not grow with the resolution of the data.
+
+    streamlines = True draws ax.streamplot (structured, evenly spaced grids only) instead of arrows,
+    color_magnitude = True colours arrows/streamlines by |(dx, dy)| with cmap (and a colorbar with cbar).
+    """
+    def __init__(self, x, y, dx, dy, x_label = "x", y_label = "f(x)", **vec_kwarg):
+        super().__init__(x_label, y_label)
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.dx = np.asarray(dx)
+        self.dy = np.asarray(dy)
+        self.vec_kwarg = vec_kwarg
 
-        if 'linestyle' not in self.line_kwargs:
-            self.line_kwargs["linestyle"] = self.linestyle
+        if not (self.x.shape == self.y.shape == self.dx.shape == self.dy.shape):
+            raise ValueError("x, y, dx and dy must have the same shape")
 
-        if 'linewidth' not in self.line_kwargs:
-            self.line_kwargs["linewidth"] = self.linewidth
+        # Special ax properties
+        self.legend = []
+        self.cbar = False
+        self.cbar_label = ""
 
-    def plot(self, ax):
+        # Default vector properties
+        self.arrows_per_inch = 4
+        self.subsample = True
+        self.streamlines = False
+        self.stream_density = 1
+        self.stream_linewidth = None
+        self.color_magnitude = False
+        self.cmap = "viridis"
+        self.color_no = None
+        self.default_colors = None
+
+    @classmethod
+    def from_grid(cls, grid, dx, dy, **kwargs):
+        'Vector field with the components dx, dy (flattened like the grid nodes or shaped) on a 2D Grid'
+        dx, dy = np.asarray(dx), np.asarray(dy)
+        if dx.ndim == 1:
+            dx, dy = grid.reshape_data(dx), grid.reshape_data(dy)
+        kwargs.setdefault("x_label", grid.labels[0])
+        kwargs.setdefault("y_label", grid.labels[1])
+        return cls(grid.meshgrid_mat[0], grid.meshgrid_mat[1], dx, dy, **kwargs)
+
+    @classmethod
+    def from_grid_data(cls, data, samples = (0, 1), **kwargs):
+        'Vector field from the two samples (components) of a GridData on a 2D Grid'
+        components = data.get_shaped_data(list(samples))
+        return cls.from_grid(data.domain, components[0], components[1], **kwargs)
+
+    def target_arrows(self, ax):
+        'Number of arrows along x and y for the size of the axis in the figure'
+        position = ax.get_position()
+        width = position.width * ax.figure.get_figwidth()
+        height = position.height * ax.figure.get_figheight()
+        return max(int(width * self.arrows_per_inch), 2), max(int(height * self.arrows_per_inch), 2)
+
+    def get_arrows(self, ax):
+        'Points and components of the drawn arrows'
+        if not self.subsample:
+            return self.x, self.y, self.dx, self.dy
+
+        n_x, n_y = self.target_arrows(ax)
+        if self.x.ndim == 2:
+            step_y = max(int(np.ceil(self.x.shape[0] / n_y)), 1)
+            step_x = max(int(np.ceil(self.x.shape[1] / n_x)), 1)
+            select = (slice(None, None, step_y), slice(None, None, step_x))
+            return self.x[select], self.y[select], self.dx[select], self.dy[select]
+
+        x, y = self.x.ravel(), self.y.ravel()
+        if x.size <= n_x * n_y:
+            return x, y, self.dx.ravel(), self.dy.ravel()
+
+        # Scattered points: the first point in every cell of a n_x x n_y raster
+        cell_x = np.clip(((x - x.min()) / max(np.ptp(x), 1e-300) * n_x).astype(int), 0, n_x - 1)
+        cell_y = np.clip(((y - y.min()) / max(np.ptp(y), 1e-300) * n_y).astype(int), 0, n_y - 1)
+        _, keep = np.unique(cell_y * n_x + cell_x, return_index = True)
+        return x[keep], y[keep], self.dx.ravel()[keep], self.dy.ravel()[keep]
+
+    def get_color_kwargs(self):
+        if self.color_magnitude:
+            return {"cmap": self.vec_kwarg.get("cmap", self.cmap)}
+        if self.color_no is not None and "color" not in self.vec_kwarg:
+            colors = self.default_colors if self.default_colors is not None else get_default_colors()
+            return {"color": colors[self.color_no]}
+        return {}
+
+    def draw(self, ax):
+        kwargs = dict(self.vec_kwarg)
+
+        if self.streamlines:
+            if self.x.ndim != 2:
+                raise ValueError("Streamlines need the field on a structured grid (2D arrays or from_grid)")
+            magnitude = np.hypot(self.dx, self.dy) if self.color_magnitude else None
+            kwargs.update(self.get_color_kwargs())
+            kwargs.setdefault("density", self.stream_density)
+            if self.stream_linewidth is not None:
+                kwargs.setdefault("linewidth", self.stream_linewidth)
+            if magnitude is not None:
+                kwargs["color"] = magnitude
+            mappable = ax.streamplot(self.x[0, :], self.y[:, 0], self.dx, self.dy, **kwargs).lines
+        else:
+            x, y, dx, dy = self.get_arrows(ax)
+            magnitude = np.hypot(dx, dy) if self.color_magnitude else None
+            kwargs.update(self.get_color_kwargs())
+            args = (x, y, dx, dy) if magnitude is None else (x, y, dx, dy, magnitude)
+            mappable = ax.quiver(*args, **kwargs)
+
+        if self.cbar and self.color_magnitude:
+            cbar = plt.colorbar(mappable, ax = ax)
+            cbar.set_label(self.cbar_label)
 
-        if self.color_no is not None:
-            self.line_kwargs["color"] = self.default_colors[self.color_no]
-
-        ax.quiver(self.x, self.y,self.dx, self.dy, **self.line_kwargs)
-        ax.set_yscale(self.y_scale)
-        ax.set_xscale(self.x_scale)
-        ax.grid(self.plot_grid)
-        ax.set_title(self.title)
-        ax.tick_params(labelbottom = self.draw_xticks, labelleft = self.draw_yticks)
         return ax
 
 class BarPlot(Axes2D):
@@ -247,7 +488,7 @@ class BarPlot(Axes2D):
         self.x_ticklabels = None
         self.x_ticklabels_rot = 0
 
-    def plot(self, ax):
+    def draw(self, ax):
 
         ax.bar(self.x, self.y, **self.bar_kwargs)
         
@@ -255,10 +496,100 @@ class BarPlot(Axes2D):
             ax.set_xticks(np.asarray([i for i in range(len(self.x_ticklabels))]))
             ax.set_xticklabels(self.x_ticklabels, rotation= self.x_ticklabels_rot)
 
-        ax = self.set_2D_ax_properties(ax)
 
         return ax
 
+class SharedColorScale:
+    """ One color scale (levels, norm and colorbar) for several ContourPlot/TriContourPlot subplots
+
+    The global min/max is reduced chunk by chunk over all added fields, so memory mapped fields larger
+    than the memory can be used. Levels and norm are computed once and reused by every plot (update() resets
+    them); Plotter.plot draws a single colorbar next to all axes of the scale.
+
+        scale = SharedColorScale(n_levels = 50, label = "f(x)")
+        scale.add(*contour_plots)
+        Plotter().plot(*contour_plots)
+    """
+    def __init__(self, n_levels = 50, cmap = "viridis", label = "", v_min = None, v_max = None, chunk_size = 2**20):
+        self.n_levels = n_levels
+        self.cmap = cmap
+        self.label = label
+        self.v_min = v_min
+        self.v_max = v_max
+        self.chunk_size = chunk_size
+        self.cbar_ticks = None
+        self.fixed_limits = v_min is not None and v_max is not None
+        self._levels = None
+        self._norm = None
+
+    def update(self, values):
+        'Extends the min/max by values (any array like, NaNs are ignored)'
+        if self.fixed_limits:
+            return self
+
+        # The limits may change, levels and norm are computed again on the next use
+        self._levels = None
+        self._norm = None
+        values = np.asarray(values).reshape(-1)
+        for start in range(0, values.size, self.chunk_size):
+            chunk = values[start:start + self.chunk_size]
+            if np.all(np.isnan(chunk)):
+                continue
+            chunk_min = np.nanmin(chunk)
+            chunk_max = np.nanmax(chunk)
+            self.v_min = chunk_min if self.v_min is None else min(self.v_min, chunk_min)
+            self.v_max = chunk_max if self.v_max is None else max(self.v_max, chunk_max)
+
+        return self
+
+    def add(self, *plots):
+        'Uses the scale for the plots and includes their fields in the min/max'
+        for plot_item in plots:
+            if isinstance(plot_item, ContourPlot):
+                self.update(plot_item.grid_val)
+            elif isinstance(plot_item, TriContourPlot):
+                self.update(plot_item.z)
+            else:
+                raise ValueError(f"SharedColorScale only supports ContourPlot and TriContourPlot, not {type(plot_item).__name__}")
+            plot_item.color_scale = self
+
+        return self
+
+    def limits(self):
+        if self.v_min is None:
+            raise ValueError("SharedColorScale has no data, add plots or call update first")
+        if self.v_max > self.v_min:
+            return float(self.v_min), float(self.v_max)
+        # Constant fields still need increasing levels
+        return float(self.v_min), float(self.v_min) + 1.0
+
+    @property
+    def levels(self):
+        # Scales pickled by older versions have no cached levels and norm
+        if getattr(self, "_levels", None) is None:
+            if not np.isscalar(self.n_levels):
+                self._levels = np.asarray(self.n_levels)
+            else:
+                self._levels = np.linspace(*self.limits(), int(self.n_levels))
+        return self._levels
+
+    @property
+    def norm(self):
+        if getattr(self, "_norm", None) is None:
+            v_min, v_max = self.limits()
+            self._norm = mcolors.Normalize(vmin = v_min, vmax = v_max)
+        return self._norm
+
+    def contour_kwargs(self):
+        return {"levels": self.levels, "norm": self.norm, "cmap": self.cmap}
+
+    def add_colorbar(self, fig, axes):
+        'Draws one colorbar for all axes using this scale'
+        mappable = plt.cm.ScalarMappable(norm = self.norm, cmap = self.cmap)
+        cbar = fig.colorbar(mappable, ax = axes, ticks = self.cbar_ticks, boundaries = self.levels)
+        cbar.set_label(self.label)
+        return cbar
+
 class ContourPlot(Axes2D):
     def __init__(self, domain_grid, grid_val, **kwargs):
         super().__init__()
@@ -276,6 +607,7 @@ class ContourPlot(Axes2D):
         self.plot_grid = False
         self.legend = []
         self.edgecolor = None
+        self.color_scale = None
 
         # Default cont properties
         self.levels = 50
@@ -292,7 +624,7 @@ class ContourPlot(Axes2D):
         if 'cmap' not in self.kwargs:
             self.kwargs["cmap"] = self.cmap
         
-    def plot(self, ax):
+    def draw(self, ax):
 
         self.set_default_cont_kwarg()
 
@@ -304,7 +636,7 @@ class ContourPlot(Axes2D):
         else:
             zz = self.grid.reshape_data(self.grid_val)
             
-        cs = ax.contourf(xx,yy,zz, **self.kwargs)
+        cs = ax.contourf(xx,yy,zz, **get_contour_kwargs(self))
         if self.cbar:
             if self.cbar_ticks is not None:
                 cbar = plt.colorbar(cs, ax = ax, ticks = self.cbar_ticks)
@@ -316,17 +648,27 @@ class ContourPlot(Axes2D):
             for c in cs.collections:
                 c.set_edgecolor(self.edgecolor)
 
-        ax = self.set_2D_ax_properties(ax)
     
         return ax
     
+def get_contour_kwargs(plot_item):
+    'Contour kwargs of a plot, levels, norm and cmap come from its SharedColorScale if it has one'
+    color_scale = getattr(plot_item, "color_scale", None)
+    if color_scale is None:
+        return plot_item.kwargs
+    kwargs = dict(plot_item.kwargs)
+    kwargs.update(color_scale.contour_kwargs())
+    return kwargs
+
 class TriContourPlot(Axes2D):
-    def __init__(self, x, y, z, triangles, x_label = "x", y_label = "y", **kwargs):
+    def __init__(self, x, y, z, triangles, x_label = "x", y_label = "y", mesh = None, **kwargs):
         super().__init__()
 
-        self.triangles = triangles
-        self.x = x
-        self.y = y
+        # The plot keeps the mesh by reference, x, y and triangles are the arrays of the mesh
+        self.mesh = mesh if mesh is not None else TriMesh(x, y, triangles)
+        self.triangles = self.mesh.triangles
+        self.x = self.mesh.x
+        self.y = self.mesh.y
         self.z = z
         self.kwargs = kwargs
 
@@ -338,6 +680,8 @@ class TriContourPlot(Axes2D):
         self.y_label = y_label
         self.plot_grid = False
         self.legend = []
+        self.color_scale = None
+        self.subdiv = 0
 
         # Default cont properties
         self.levels = 50
@@ -346,6 +690,11 @@ class TriContourPlot(Axes2D):
         # Set custom Plot Style
         self.set_default_tri_cont_kwarg()
 
+    @classmethod
+    def from_mesh(cls, mesh, z, **kwargs):
+        'Contour plot of the nodal field z on a TriMesh shared with other plots'
+        return cls(mesh.x, mesh.y, z, mesh.triangles, mesh = mesh, **kwargs)
+
     def set_default_tri_cont_kwarg(self):
 
         if 'levels' not in self.kwargs:
@@ -354,12 +703,20 @@ class TriContourPlot(Axes2D):
         if 'cmap' not in self.kwargs:
             self.kwargs["cmap"] = self.cmap
         
-    def plot(self, ax):
+    def draw(self, ax):
 
         self.set_default_tri_cont_kwarg()
 
-        triangulation = Triangulation(self.x,self.y, triangles = self.triangles)
-        cs = ax.tricontourf(triangulation, self.z, **self.kwargs)
+        mesh = getattr(self, "mesh", None)
+        if mesh is None:
+            mesh = self.mesh = TriMesh(self.x, self.y, self.triangles)
+
+        # Refined meshes give smooth contours of coarse meshes
+        if getattr(self, "subdiv", 0) > 0:
+            triangulation, z = mesh.refine_field(self.z, subdiv = self.subdiv)
+        else:
+            triangulation, z = mesh.get_triangulation(), self.z
+        cs = ax.tricontourf(triangulation, z, **get_contour_kwargs(self))
         if self.cbar:
             if self.cbar_ticks is not None:
                 cbar = plt.colorbar(cs, ax = ax, ticks = self.cbar_ticks)
@@ -367,26 +724,125 @@ class TriContourPlot(Axes2D):
                 cbar = plt.colorbar(cs, ax = ax)
             cbar.set_label(self.cbar_label)
 
-        ax = self.set_2D_ax_properties(ax)
     
         return ax
 
 class ImagePlot(Axes2D):
-    def __init__(self, image, x_label = "x", y_label = "y", **img_kwargs):
+    """ Image drawn with imshow, large images are downsampled to the output resolution first
+
+    image is an array (n_rows x n_cols or n_rows x n_cols x channels), a memmap or the path of a .npy
+    file, which is opened as memmap. roi = (row_start, row_stop, col_start, col_stop) crops the image
+    before resampling. If the (cropped) image has more pixels than the axis at dpi, blocks of pixels are
+    pooled ("mean" or "max", pooling = None draws the full image). The memmap is read in strips, so the
+    render cost and memory depend on the output size, not on the size of the image. The axis keeps the
+    pixel coordinates of the full image (or extent, if given).
+    """
+    def __init__(self, image, x_label = "x", y_label = "y", roi = None, pooling = "mean", **img_kwargs):
         super().__init__(x_label, y_label)
-        self.image = image
+        self.image = np.load(image, mmap_mode = "r") if isinstance(image, str) else image
+        if not hasattr(self.image, "shape"):
+            self.image = np.asarray(self.image)
         self.img_kwargs = img_kwargs
+        self.roi = roi
+        self.pooling = pooling
         self.legend = ""
         self.plot_grid = False
 
-    def plot(self, ax):
-
-        ax.imshow(self.image, **self.img_kwargs)
-       
-        ax = self.set_2D_ax_properties(ax)
+        # Output resolution for the downsampling, the png resolution of Plotter.save_plot
+        self.dpi = PNG_DPI
+        self.strip_bytes = 2**26
+
+    def get_roi(self):
+        n_rows, n_cols = self.image.shape[0:2]
+        if self.roi is None:
+            return 0, n_rows, 0, n_cols
+        row_start, row_stop, col_start, col_stop = self.roi
+        row_start, row_stop = max(int(row_start), 0), min(int(row_stop), n_rows)
+        col_start, col_stop = max(int(col_start), 0), min(int(col_stop), n_cols)
+        if row_stop <= row_start or col_stop <= col_start:
+            raise ValueError(f"Region of interest {self.roi} is outside of the image ({n_rows} x {n_cols})")
+        return row_start, row_stop, col_start, col_stop
+
+    def get_extent(self, roi):
+        'Extent of the cropped image in the coordinates of the full image'
+        row_start, row_stop, col_start, col_stop = roi
+        # With origin "lower" the first row is drawn at the bottom
+        lower = self.img_kwargs.get("origin", mpl.rcParams["image.origin"]) == "lower"
+        if "extent" not in self.img_kwargs:
+            if lower:
+                return (col_start - 0.5, col_stop - 0.5, row_start - 0.5, row_stop - 0.5)
+            return (col_start - 0.5, col_stop - 0.5, row_stop - 0.5, row_start - 0.5)
+
+        left, right, bottom, top = self.img_kwargs["extent"]
+        n_rows, n_cols = self.image.shape[0:2]
+        x = lambda col: left + (right - left) * col / n_cols
+        if lower:
+            y = lambda row: bottom + (top - bottom) * row / n_rows
+            return (x(col_start), x(col_stop), y(row_start), y(row_stop))
+        y = lambda row: top + (bottom - top) * row / n_rows
+        return (x(col_start), x(col_stop), y(row_stop), y(row_start))
+
+    def get_block_size(self, ax, n_rows, n_cols):
+        'Pixels per block along rows and columns so the image does not exceed the pixels of the axis'
+        position = ax.get_position()
+        out_cols = max(int(position.width * ax.figure.get_figwidth() * self.dpi), 1)
+        out_rows = max(int(position.height * ax.figure.get_figheight() * self.dpi), 1)
+        block = max(int(np.ceil(n_rows / out_rows)), int(np.ceil(n_cols / out_cols)), 1)
+        return block
+
+    def get_image(self, ax):
+        roi = self.get_roi()
+        row_start, row_stop, col_start, col_stop = roi
+        block = self.get_block_size(ax, row_stop - row_start, col_stop - col_start) if self.pooling is not None else 1
+        if block == 1:
+            return np.asarray(self.image[row_start:row_stop, col_start:col_stop]), roi
+        return pool_image(self.image, roi, block, self.pooling, self.strip_bytes), roi
+
+    def draw(self, ax):
+
+        image, roi = self.get_image(ax)
+        img_kwargs = dict(self.img_kwargs)
+        if self.roi is not None or "extent" in img_kwargs or image.shape[0:2] != self.image.shape[0:2]:
+            img_kwargs["extent"] = self.get_extent(roi)
+        ax.imshow(image, **img_kwargs)
 
         return ax
 
+def pool_image(image, roi, block, pooling = "mean", strip_bytes = 2**26):
+    """ Image downsampled by pooling block x block pixels (mean or max), the last blocks may be smaller
+
+    The image (e.g. a memmap) is read in strips of about strip_bytes within roi.
+    """
+    if pooling not in ["mean", "max"]:
+        raise ValueError(f'Unknown pooling "{pooling}", use "mean" or "max"')
+
+    row_start, row_stop, col_start, col_stop = roi
+    col_edges = np.arange(0, col_stop - col_start, block)
+    col_counts = np.diff(np.append(col_edges, col_stop - col_start))
+    # The mean casts the strip to float
+    itemsize = max(image.itemsize, 8) if pooling == "mean" else image.itemsize
+    row_bytes = max((col_stop - col_start) * itemsize * int(np.prod(image.shape[2:])), 1)
+    rows_per_strip = max(strip_bytes // (row_bytes * block), 1) * block
+
+    strips = []
+    for strip_start in range(row_start, row_stop, rows_per_strip):
+        strip = np.asarray(image[strip_start:min(strip_start + rows_per_strip, row_stop), col_start:col_stop])
+        row_edges = np.arange(0, strip.shape[0], block)
+        if pooling == "max":
+            pooled = np.maximum.reduceat(np.maximum.reduceat(strip, row_edges, axis = 0), col_edges, axis = 1)
+        else:
+            row_counts = np.diff(np.append(row_edges, strip.shape[0]))
+            pooled = np.add.reduceat(np.add.reduceat(strip, row_edges, axis = 0, dtype = float), col_edges, axis = 1)
+            counts = np.outer(row_counts, col_counts)
+            pooled /= counts.reshape(counts.shape + (1,) * (pooled.ndim - 2))
+        strips.append(pooled)
+    pooled = np.concatenate(strips, axis = 0)
+
+    # Integer images (e.g. uint8 RGB) keep their value range for imshow
+    if pooling == "mean" and np.issubdtype(image.dtype, np.integer):
+        pooled = np.rint(pooled).astype(image.dtype)
+    return pooled
+
 class ScatterPlot(Axes2D):
     def __init__(self, x, y, s = None, **scatter_kwargs):
         super().__init__()
@@ -413,11 +869,10 @@ class ScatterPlot(Axes2D):
         if 'alpha' not in self.scatter_kwargs:
             self.scatter_kwargs["alpha"] = self.alpha
 
-    def plot(self, ax):
+    def draw(self, ax):
 
         ax.scatter(self.x, self.y, s = self.s, **self.scatter_kwargs)
         
-        ax = self.set_2D_ax_properties(ax)
 
         return ax
 
@@ -446,14 +901,13 @@ class ScatterGridPlot(Axes2D):
         if 'alpha' not in self.scatter_kwargs:
             self.scatter_kwargs["alpha"] = self.alpha
 
-    def plot(self, ax):
+    def draw(self, ax):
 
         x = self.grid.nodes[:,0]
         y = self.grid.nodes[:,1]
         z = self.grid_val
         ax.scatter(x,y, s = z, **self.scatter_kwargs)
         
-        ax = self.set_2D_ax_properties(ax)
 
         return ax
 
@@ -485,11 +939,12 @@ class RectanglePlot(Axes2D):
         if 'lw' not in self.rect_kwargs:
             self.rect_kwargs["lw"] = self.lw
 
-    def plot(self, ax):
-        ax.add_patch(Rectangle(self.xy, self.width, self.height, **self.rect_kwargs))
-       
-        ax = self.set_default_rect_kwargs(ax)
-    
+    def draw(self, ax):
+
+        self.set_default_rect_kwargs()
+
+        ax.add_patch(patches.Rectangle(self.xy, self.width, self.height, **self.rect_kwargs))
+
         return ax
 
 class PolygonPlot(Axes2D):
@@ -518,17 +973,97 @@ class PolygonPlot(Axes2D):
         if 'lw' not in self.poly_kwargs:
             self.poly_kwargs["lw"] = self.lw
 
-    def plot(self, ax):
+    def draw(self, ax):
 
         self.set_default_poly_kwargs()
         
-        ax.add_patch(Polygon(self.xy, **self.poly_kwargs))   
-        ax = self.set_2D_ax_properties(ax)
+        ax.add_patch(patches.Polygon(self.xy, **self.poly_kwargs))   
 
         return ax
-    
+
+class PolygonCollectionPlot(Axes2D):
+    """ Draws many polygons (FE cells, bounding boxes, ...) as one PolyCollection
+
+    polygons is an array n_polygons x n_vertices x 2 or a list of n_vertices x 2 arrays (different
+    numbers of vertices). With values (one per polygon) the faces are colored with cmap, otherwise the
+    polygons use facecolor/edgecolor like PolygonPlot. Drawing is one call for all polygons, so 1e5
+    shapes are one plot item instead of 1e5 patches. Beyond rasterize_above polygons the collection is
+    embedded as image in pdf/svg files, which keeps their size and writing time bounded.
+    """
+    def __init__(self, polygons, values = None, x_label = "x", y_label = "y", **poly_kwargs):
+        super().__init__(x_label, y_label)
+        self.polygons = polygons if isinstance(polygons, list) else np.asarray(polygons, dtype = float)
+        self.values = None if values is None else np.asarray(values)
+        self.poly_kwargs = poly_kwargs
+
+        # Special ax properties
+        self.legend = []
+        self.facecolor = 'none'
+        self.edgecolor = 'black'
+        self.lw = 1
+        self.cmap = "viridis"
+        self.cbar = False
+        self.cbar_label = ""
+        # Above this number of polygons the collection is rasterized in vector formats (pdf, svg)
+        self.rasterize_above = 10**4
+
+    @classmethod
+    def from_mesh(cls, mesh, values = None, **kwargs):
+        'Triangles of a TriMesh, e.g. to show a field constant per element'
+        triangles = mesh.get_triangulation().get_masked_triangles()
+        return cls(np.stack([mesh.x[triangles], mesh.y[triangles]], axis = -1), values, **kwargs)
+
+    def collection_kwargs(self):
+        kwargs = {"edgecolors": self.edgecolor, "linewidths": self.lw}
+        if self.values is not None:
+            kwargs["array"] = self.values
+            kwargs["cmap"] = self.cmap
+        else:
+            kwargs["facecolors"] = self.facecolor
+        if self.rasterize_above is not None and len(self.polygons) > self.rasterize_above:
+            kwargs["rasterized"] = True
+        kwargs.update(self.poly_kwargs)
+        return kwargs
+
+    def draw(self, ax):
+        polygons = mcoll.PolyCollection(self.polygons, closed = True, **self.collection_kwargs())
+        ax.add_collection(polygons)
+        ax.autoscale_view()
+
+        if self.cbar and self.values is not None:
+            cbar = plt.colorbar(polygons, ax = ax)
+            cbar.set_label(self.cbar_label)
+
+        return ax
+
+class RectangleCollectionPlot(PolygonCollectionPlot):
+    'Rectangles with lower left corners x, y and sizes width, height (arrays or scalars) as one PolyCollection'
+    def __init__(self, x, y, width, height, values = None, x_label = "x", y_label = "y", **poly_kwargs):
+        x, y, width, height = np.broadcast_arrays(*[np.asarray(value, dtype = float) for value in [x, y, width, height]])
+        x, y, width, height = [value.reshape(-1) for value in [x, y, width, height]]
+
+        # n_rectangles x 4 corners x 2
+        corners = np.empty((x.size, 4, 2))
+        corners[:, [0, 3], 0] = x[:, None]
+        corners[:, [1, 2], 0] = (x + width)[:, None]
+        corners[:, [0, 1], 1] = y[:, None]
+        corners[:, [2, 3], 1] = (y + height)[:, None]
+        super().__init__(corners, values, x_label, y_label, **poly_kwargs)
+
+    @classmethod
+    def from_bounds(cls, bounds, values = None, **kwargs):
+        'Rectangles from an array of bounding boxes x_min, y_min, x_max, y_max (n x 4)'
+        bounds = np.asarray(bounds, dtype = float).reshape(-1, 4)
+        return cls(bounds[:, 0], bounds[:, 1], bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1], values, **kwargs)
+
+# Above this number of subplots Plotter.plot uses the constrained layout instead of tight_layout
+MAX_TIGHT_LAYOUT_SUBPLOTS = 16
+
+# Resolution of the saved png files, ImagePlot downsamples large images to it
+PNG_DPI = 600
+
 class PlotData():
-    def __init__(self, plots, filename, savepath, stylesheet, fig_size, custom_fig, subplot_grid, insert):
+    def __init__(self, plots, filename, savepath, stylesheet, fig_size, custom_fig, subplot_grid, insert, sharex = False, sharey = False, layout = "auto"):
         self.plots = plots
         self.filename = filename
         self.fig_size = fig_size
@@ -537,6 +1072,9 @@ class PlotData():
         self.stylesheet = stylesheet
         self.subplot_grid = subplot_grid
         self.insert = insert     
+        self.sharex = sharex
+        self.sharey = sharey
+        self.layout = layout
 
 class Plotter():
     def __init__(self, save_path = None, stylesheet = None, save_format = "pdf", ink_path = r'C:\Program Files\Inkscape', save_plot_data = True, open_saved_plot = True):
@@ -548,58 +1086,101 @@ class Plotter():
         self.open_saved_plot = open_saved_plot
         self.ink_path = ink_path
 
-    def plot(self, *plots, filename = None, fig_size = None, fig_title = None, subplot_grid = None, custom_fig = None, insert = "row", plt_show = True):
+    def plot(self, *plots, filename = None, fig_size = None, fig_title = None, subplot_grid = None, custom_fig = None, insert = "row", plt_show = True, sharex = False, sharey = False, layout = "auto"):
 
         if filename is not None: filename = filename.replace(" ", "_")
         n_subplots = len(plots)
 
-        # load stylesheet if specified
-        if self.stylesheet is not None:
-            plt.style.use(self.stylesheet)
+        with span("plot", figure = filename or "Plot", n_subplots = n_subplots) as plot_span:
+            color_scales = get_color_scales(plots)
 
-        # Create figure and ax object
-        if custom_fig is not None:
-            fig = custom_fig[0]
-            ax = custom_fig[1]
-        else:
-            fig, ax = create_figure(n_subplots, subplot_grid, fig_size, insert = insert)
+            # tight_layout gets slow for many axes and cannot place colorbars shared by several axes,
+            # these figures use the constrained layout engine instead
+            if layout == "auto":
+                use_constrained = n_subplots > MAX_TIGHT_LAYOUT_SUBPLOTS or len(color_scales) > 0
+                layout = "constrained" if use_constrained and custom_fig is None else "tight"
+
+            # load stylesheet if specified
+            if self.stylesheet is not None:
+                plt.style.use(self.stylesheet)
+
+            # Create figure and ax object
+            with span("create_figure"):
+                if custom_fig is not None:
+                    fig = custom_fig[0]
+                    ax = custom_fig[1]
+                else:
+                    fig, ax = create_figure(n_subplots, subplot_grid, fig_size, insert = insert, sharex = sharex, sharey = sharey,
+                                            layout = "constrained" if layout == "constrained" else None)
+
+            # Loop over subplots
+            with span("draw"):
+                for i, subplot in enumerate(plots):
 
-        # Loop over subplots
-        for i, subplot in enumerate(plots):
+                    # Loop over plots in subplot, the axis settings are applied once after all plots are drawn
+                    if not isinstance(subplot, Iterable): subplot = [subplot]
+                    styled_items = []
+                    for j, plot_item in enumerate(subplot):
 
-            has_legend = False
+                        if hasattr(plot_item, "draw"):
+                            ax[i] = plot_item.draw(ax[i])
+                            styled_items.append(plot_item)
+                        else:
+                            ax[i] = plot_item.plot(ax[i])
+
+                    if styled_items:
+                        apply_ax_properties(ax[i], merge_ax_properties(styled_items))
+
+                    if not ax[i].get_legend_handles_labels() == ([], []):
+                        ax[i].legend(loc = getattr(subplot[-1], "leg_pos", "best"))
+
+                # One colorbar per shared color scale, next to all of its axes
+                for color_scale, scale_axes in color_scales:
+                    color_scale.add_colorbar(fig, [ax[i] for i in scale_axes])
             
-            # Loop over plots in subplot
-            if not isinstance(subplot, Iterable): subplot = [subplot]
-            for j, plot_item in enumerate(subplot):
-                                    
-                ax[i] = plot_item.plot(ax[i])
-
-                if not ax[i].get_legend_handles_labels() == ([], []): has_legend = True        
-                if has_legend: ax[i].legend(loc = plot_item.leg_pos)
-        
-        if fig_title is not None:
-            fig.suptitle(fig_title)    
-
-        plt.tight_layout()
-        # Saving
-        if self.save_path is not None:
-            unique_filename = self.save_plot(self.save_path, filename, fig)
-            if self.save_plot_data:
-                data_filename = self.save_path + "/_plt_data/data_" +  unique_filename + ".pkl"
-                isExist = os.path.exists(self.save_path + "/_plt_data")
-                if not isExist: os.makedirs(self.save_path + "/_plt_data")
-                plt_data = PlotData(plots, filename, self.save_path, self.stylesheet, fig_size, custom_fig, subplot_grid, insert)
-                with open(data_filename, 'wb') as file:
-                    pickle.dump(plt_data, file)
-
-                self.create_plotfile(self.save_path, unique_filename, data_filename)
-        elif plt_show:
-            plt.show()
+                if fig_title is not None:
+                    fig.suptitle(fig_title)    
+
+            with span("layout", layout = layout):
+                if layout == "tight":
+                    fig.tight_layout()
+                elif layout == "constrained":
+                    # A custom figure has no layout engine unless it was created with one
+                    if fig.get_layout_engine() is None:
+                        fig.set_layout_engine("constrained")
+                    # Solve the constrained layout once, otherwise it is solved again on every draw and save
+                    fig.get_layout_engine().execute(fig)
+                    fig.set_layout_engine("none")
+            # Saving
+            if self.save_path is not None:
+                unique_filename = self.save_plot(self.save_path, filename, fig)
+                if plot_span is not None:
+                    plot_span["figure"] = os.path.join(self.save_path, unique_filename)
+                if self.save_plot_data:
+                    data_filename = self.save_path + "/_plt_data/data_" +  unique_filename + ".pkl"
+                    isExist = os.path.exists(self.save_path + "/_plt_data")
+                    if not isExist: os.makedirs(self.save_path + "/_plt_data")
+                    with span("pickle_plot_data"):
+                        plt_data = PlotData(plots, filename, self.save_path, self.stylesheet, fig_size, custom_fig, subplot_grid, insert, sharex, sharey, layout)
+                        with open(data_filename, 'wb') as file:
+                            pickle.dump(plt_data, file)
+                        # The stylesheet files of the plot, sky.regenerate renders the plot again when they change
+                        with open(get_style_sidecar(data_filename), 'w') as file:
+                            json.dump(get_stylesheet_files(self.stylesheet), file)
+
+                    self.create_plotfile(self.save_path, unique_filename, data_filename)
+            elif plt_show:
+                with span("show"):
+                    plt.show()
 
         return fig, ax
 
     def save_plot(self, path, filename, fig):
+
+        with span("save_plot", format = self.save_format):
+            return self.write_plot(path, filename, fig)
+
+    def write_plot(self, path, filename, fig):
         
         # Output Folder
         now = datetime.now()
@@ -609,13 +1190,18 @@ class Plotter():
             name = "Plot"
         else:
             name = filename
-        unique_filename = time_string + "_" + name
+        # Reserve the file, plots saved within the same second get the microseconds as suffix
+        extension = "png" if self.save_format == "png" else "pdf"
+        unique_filename = allocate_file(path, time_string + "_" + name, extension)
 
         if self.save_format == "pdf":
-            plt.savefig(path + "/" +  unique_filename + ".pdf") 
+            with span("savefig", format = "pdf"):
+                plt.savefig(path + "/" +  unique_filename + ".pdf") 
         elif self.save_format == "png":
-            plt.savefig(path + "/" +  unique_filename + ".png", format='png', dpi = 600)
+            with span("savefig", format = "png"):
+                plt.savefig(path + "/" +  unique_filename + ".png", format='png', dpi = PNG_DPI)
         elif self.save_format == "latex":
+            from sky.pdftex_export import latex_graphic_export
             cwd = os.getcwd()
             filepath = os.path.join(cwd, path)
             latex_graphic_export(fig, graphic_name=unique_filename,
@@ -626,6 +1212,8 @@ class Plotter():
             unique_filename = unique_filename + "Control"
             os.chdir(cwd)
 
+        record_run(path, plot = unique_filename + "." + extension)
+
         # Open PDF in vs code
         if self.open_saved_plot:
             if self.save_format == "latex":
@@ -638,6 +1226,11 @@ class Plotter():
         return unique_filename
     
     def create_plotfile(self, path, filename, data_file_path):
+
+        with span("create_plotfile"):
+            self.write_plotfile(path, filename, data_file_path)
+
+    def write_plotfile(self, path, filename, data_file_path):
         
         # Get package name:
         # folder = glob.glob("./src/*.egg-info")
@@ -657,7 +1250,10 @@ class Plotter():
         f.write("fig_size = plt_data.fig_size \n")
         f.write("custom_fig = plt_data.custom_fig \n")
         f.write("insert = plt_data.insert \n")
-        f.write("subplot_grid = plt_data.subplot_grid \n \n")
+        f.write("subplot_grid = plt_data.subplot_grid \n")
+        f.write("sharex = getattr(plt_data, 'sharex', False) \n")
+        f.write("sharey = getattr(plt_data, 'sharey', False) \n")
+        f.write("layout = getattr(plt_data, 'layout', 'auto') \n \n")
 
         f.write("# Recreate plot \n")
         f.write("folder_path = save_path + '/regenerated_plots' \n")
@@ -665,100 +1261,97 @@ class Plotter():
         f.write("if not isExist: \n")
         f.write("   os.makedirs(folder_path)\n")
         f.write("plotter = Plotter(save_path = save_path + '/regenerated_plots', stylesheet= stylesheet, save_plot_data = False) \n")
-        f.write("plotter.plot(*plots, filename = filename, fig_size = fig_size, custom_fig = custom_fig, subplot_grid = subplot_grid, insert = insert) \n")
-
-def create_figure(n_subplots, subplot_grid, fig_size, insert = "row"):
+        f.write("plotter.plot(*plots, filename = filename, fig_size = fig_size, custom_fig = custom_fig, subplot_grid = subplot_grid, insert = insert, sharex = sharex, sharey = sharey, layout = layout) \n")
+
+def get_stylesheet_files(stylesheet):
+    'Absolute paths of the files of a stylesheet (path, name in the user style library or list of them)'
+    styles = stylesheet if isinstance(stylesheet, (list, tuple)) else [stylesheet]
+    files = []
+    for style in styles:
+        if not isinstance(style, str):
+            continue
+        if os.path.isfile(style):
+            files.append(os.path.abspath(style))
+            continue
+        library_file = os.path.join(mpl.get_configdir(), "stylelib", style + ".mplstyle")
+        if os.path.isfile(library_file):
+            files.append(library_file)
+    return files
+
+def get_style_sidecar(data_filename):
+    '_plt_data/data_<name>.pkl -> _plt_data/data_<name>.style.json'
+    return os.path.splitext(data_filename)[0] + ".style.json"
+
+def get_color_scales(plots):
+    'Shared color scales used in the subplots with the indices of their subplots'
+    color_scales = {}
+    for i, subplot in enumerate(plots):
+        if not isinstance(subplot, Iterable): subplot = [subplot]
+        for plot_item in subplot:
+            color_scale = getattr(plot_item, "color_scale", None)
+            if color_scale is None:
+                continue
+            scale_axes = color_scales.setdefault(id(color_scale), (color_scale, []))[1]
+            if i not in scale_axes:
+                scale_axes.append(i)
+    return list(color_scales.values())
+
+def get_subplot_layout(n_subplots):
+    'Rows and columns of the default subplot grid for n_subplots'
+
+    if n_subplots <= 3:
+        return 1, max(n_subplots, 1)
+    elif n_subplots == 4:
+        return 2, 2
+    elif n_subplots <= 6:
+        return 2, 3
+
+    n_col = int(np.ceil(np.sqrt(n_subplots)))
+    n_row = int(np.ceil(n_subplots / n_col))
+    return n_row, n_col
+
+def create_figure(n_subplots, subplot_grid, fig_size, insert = "row", sharex = False, sharey = False, layout = None):
         if fig_size is not None:
             fig_size = np.asarray(fig_size)
             fig_size = fig_size / 2.54      # translate cm to inch
         
         if subplot_grid is not None:
 
-            if n_subplots != subplot_grid[0]*subplot_grid[1]:
+            if n_subplots > subplot_grid[0]*subplot_grid[1]:
                 raise ValueError("The number of subplots and the user defined subplot grid are not matching")
 
             n_row = subplot_grid[0]
             n_col = subplot_grid[1]
-
-            if fig_size is None:
-                size = calc_fig_size(subplots= (n_row, n_col) )
-            else:
-                size = fig_size
-            fig, ax = plt.subplots(n_row, n_col, figsize=size)
-
-            if insert == "col":
-                ax = ax.T
-
-            ax = ax.flatten()
-
         else:
-            if n_subplots == 1:
-                n_row = 1
-                n_col = 1
-                if fig_size is None:
-                    size = calc_fig_size(subplots= (n_row, n_col) )
-                else:
-                    size = fig_size
-                fig, ax = plt.subplots(n_row, n_col, figsize=size)
-
-                ax = np.array([ax])
-
-            elif n_subplots == 2:
-                n_row = 1
-                n_col = 2
-                if fig_size is None:
-                    size = calc_fig_size(subplots= (n_row, n_col) )
-                else:
-                    size = fig_size
-                fig, ax = plt.subplots(n_row, n_col, figsize=size)
-
-                if insert == "col":
-                    ax = ax.T
-                ax = ax.flatten()
-
-            elif n_subplots == 3:
-                n_row = 1
-                n_col = 3
-                if fig_size is None:
-                    size = calc_fig_size(subplots= (n_row, n_col) )
-                else:
-                    size = fig_size
-                fig, ax = plt.subplots(n_row, n_col, figsize=size)
-
-                if insert == "col":
-                    ax = ax.T
+            n_row, n_col = get_subplot_layout(n_subplots)
 
-                ax = ax.flatten()
-
-            elif (n_subplots > 4) & (n_subplots < 7):
-                n_row = 2
-                n_col = 3
-                if fig_size is None:
-                    size = calc_fig_size(subplots= (n_row, n_col) )
-                else:
-                    size = fig_size
-                fig, ax = plt.subplots(n_row, n_col, figsize=size)
+        if fig_size is None:
+            size = calc_fig_size(subplots= (n_row, n_col) )
+        else:
+            size = fig_size
 
-                if insert == "col":
-                    ax = ax.T
+        fig, ax = plt.subplots(n_row, n_col, figsize=size, sharex=sharex, sharey=sharey, squeeze=False, layout=layout)
+        ax_grid = ax
 
-                ax = ax.flatten()
+        if insert == "col":
+            ax = ax.T
 
-            else:
-                n_col = int(np.ceil(np.sqrt(n_subplots)))
-                n_row = n_col
-                if fig_size is None:
-                    size = calc_fig_size(subplots= (n_row, n_col) )
-                else:
-                    size = fig_size
-                fig, ax = plt.subplots(n_row, n_col, figsize=size)
+        ax = ax.flatten()
 
-                if insert == "col":
-                    ax = ax.T
+        # Remove the axes which are not needed
+        for unused_ax in ax[n_subplots:]:
+            fig.delaxes(unused_ax)
 
-                ax = ax.flatten()
+        # Shared x axes only label the bottom row, a column whose bottom axis was removed needs the labels on its lowest axis
+        if sharex in (True, "all", "col") and n_subplots < n_row * n_col:
+            used_axes = set(ax[:n_subplots])
+            for column in ax_grid.T:
+                remaining = [column_ax for column_ax in column if column_ax in used_axes]
+                if remaining:
+                    remaining[-1].xaxis.set_tick_params(which = "both", labelbottom = True)
+                    remaining[-1].xaxis.offsetText.set_visible(True)
 
-        return fig, ax
+        return fig, ax[0:max(n_subplots, 1)]
 
 def calc_fig_size(subplots=(1, 1), width_pt = 450):
 
@@ -799,6 +1392,10 @@ def get_multcolumn_subplot(n_regular_plots, n_multi_colm, regular_plot_grid = No
             n_row = 4
             n_col = 4
             idx_comb = get_all_comb(np.arange(0,4,dtype=int), np.arange(0,4,dtype = int))
+        else:
+            n_col = int(np.ceil(np.sqrt(n_regular_plots)))
+            n_row = int(np.ceil(n_regular_plots / n_col))
+            idx_comb = get_all_comb(np.arange(0,n_col,dtype=int), np.arange(0,n_row,dtype = int))
     elif isinstance(regular_plot_grid, list):
         n_row = regular_plot_grid[0]
         n_col = regular_plot_grid[1]
@@ -837,6 +1434,18 @@ def get_all_comb(*vector):
 
     return nodes
 
+def create_sample_labels(para_grid, sample_ids):
+    'Labels "a = 1.00; b = 2.00" of the parameter nodes sample_ids'
+    labels = para_grid.labels[0:para_grid.n_dim]
+    return ["; ".join(f"{label} = {value:.2f}" for label, value in zip(labels, node))
+            for node in para_grid.nodes[sample_ids]]
+
+def get_sample_ids(data, sample):
+    'Indices of the selected samples, sample is None (all), an index, a list/array of indices, a slice or a mask'
+    if sample is None:
+        return np.arange(data.n_samples)
+    return np.atleast_1d(np.arange(data.n_samples)[sample])
+
 def create_plots(data, sample = 0, **plt_kwargs):
     
     plt = []
@@ -867,30 +1476,67 @@ def create_scalar_para_plots(input, output, sample = 0, **plt_kwargs):
     if isinstance(sample, int):
         sample = [sample]
 
+    labels = create_sample_labels(input, sample)
+
     # Check domain 
     if output.domain.n_dim == 1:
-        for sample_id in sample:
-            label = ""
-            for i in range(input.n_dim):
-                if i == input.n_dim - 1:
-                    label = label + f"{input.labels[i]} = {input.nodes[sample_id,i]:.2f}"
-                else:
-                    label = label + f"{input.labels[i]} = {input.nodes[sample_id,i]:.2f}; "
-            
+        for sample_id, label in zip(sample, labels):
             sample_plt = LinePlot(output.domain.nodes[:,0], output.values[:,sample_id], label = label,**plt_kwargs)
             sample_plt.y_label = output.label
             plt.append(sample_plt)
 
     elif output.domain.n_dim == 2:
-        for sample_id in sample:
-            label = ""
-            for i in range(input.n_dim):
-                label = label + f"{input.label[i]} = {input.nodes[sample_id,i]}; "
-
+        for sample_id, label in zip(sample, labels):
             sample_plt = ContourPlot(output.domain, output.values[:,sample_id], **plt_kwargs)
             sample_plt.cbar = True
             sample_plt.cbar_label = output.label
             sample_plt.title = label
             plt.append(sample_plt)
 
-    return plt
\ No newline at end of file
+    return plt
+
+def create_small_multiples(data, sample = None, para_grid = None, color_dim = 0, **plt_kwargs):
+    """ Plots many samples of data (GridData) at once, returns the subplots for Plotter.plot(*plots)
+
+    1D domain: all selected samples in one subplot, drawn as one LineCollectionPlot. With para_grid the
+    lines are colored by the parameter color_dim of their node.
+    2D domain: one ContourPlot per sample. All of them share one SharedColorScale (levels, norm and a
+    single colorbar) computed once from the selected samples.
+
+        output = run_sweep(analytic_model_1d, para_grid, x)
+        Plotter().plot(*create_small_multiples(output, para_grid = para_grid))
+    """
+    sample_ids = get_sample_ids(data, sample)
+    values = data.values[:, sample_ids]
+
+    if data.domain.n_dim == 1:
+        color_values = None
+        if para_grid is not None:
+            color_values = para_grid.nodes[sample_ids, color_dim]
+
+        lines = LineCollectionPlot(data.domain.nodes[:,0], values, x_label = data.domain.labels[0], y_label = data.label,
+                                   color_values = color_values, **plt_kwargs)
+        if para_grid is not None:
+            lines.cbar = True
+            lines.cbar_label = para_grid.labels[color_dim]
+        return [lines]
+
+    elif data.domain.n_dim == 2:
+        color_scale = SharedColorScale(n_levels = plt_kwargs.pop("levels", 50), cmap = plt_kwargs.pop("cmap", "viridis"),
+                                       label = data.label)
+        color_scale.update(values)
+
+        shaped_values = data.get_shaped_data(sample_ids)
+        titles = create_sample_labels(para_grid, sample_ids) if para_grid is not None else None
+
+        plots = []
+        for idx in range(len(sample_ids)):
+            sample_plt = ContourPlot(data.domain, shaped_values[idx], **plt_kwargs)
+            sample_plt.color_scale = color_scale
+            if titles is not None:
+                sample_plt.title = titles[idx]
+            plots.append(sample_plt)
+
+        return plots
+
+    raise ValueError(f"Small multiples are only available for 1D and 2D domains, not for {data.domain.n_dim}D")
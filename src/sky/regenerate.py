@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import pickle
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# Re-renders the plots saved with Plotter(save_plot_data = True) from their _plt_data pickles, e.g. after a
+# change of the stylesheet. Every worker imports matplotlib and sky.plotlib once and renders many plots,
+# instead of one interpreter per generated _plt_data/*.py script. Plots whose output is newer than their
+# data and the stylesheet are skipped.
+#
+#   python -m sky.regenerate results --style paper.mplstyle --format png -j 8
+#   sky-regenerate results --force
+
+PLOT_DATA_FOLDER = "_plt_data"
+OUTPUT_FOLDER = "regenerated_plots"
+FORMATS = ["pdf", "png"]
+
+def find_plot_data(root):
+    'All data_*.pkl files in _plt_data folders below root'
+    data_files = []
+    for folder, subfolders, files in os.walk(root):
+        # Regenerated plots do not store plot data
+        if OUTPUT_FOLDER in subfolders:
+            subfolders.remove(OUTPUT_FOLDER)
+        if os.path.basename(folder) != PLOT_DATA_FOLDER:
+            continue
+        data_files.extend(os.path.join(folder, name) for name in sorted(files)
+                          if name.startswith("data_") and name.endswith(".pkl"))
+    return data_files
+
+def get_output_path(data_file, save_format, output_dir = None):
+    'results/<run>/_plt_data/data_<name>.pkl -> results/<run>/regenerated_plots/<name>.<format>'
+    name = os.path.basename(data_file)[len("data_"):-len(".pkl")]
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.dirname(data_file)), OUTPUT_FOLDER)
+    return os.path.join(output_dir, name + "." + save_format)
+
+def get_stored_stylesheet_files(data_file):
+    """ Stylesheet files the plot was saved with, read from the sidecar file next to the pickle
+
+    Plot data saved before the sidecar existed is unpickled once and the sidecar is written.
+    """
+    from sky.plotlib import get_style_sidecar
+    sidecar = get_style_sidecar(data_file)
+    if os.path.exists(sidecar):
+        with open(sidecar, 'r') as file:
+            return json.load(file)
+
+    from sky.plotlib import get_stylesheet_files
+    with open(data_file, 'rb') as file:
+        files = get_stylesheet_files(pickle.load(file).stylesheet)
+    with open(sidecar, 'w') as file:
+        json.dump(files, file)
+    return files
+
+def is_up_to_date(data_file, output_path, stylesheet = None):
+    """ True if the output is newer than the plot data and its stylesheet files
+
+    These are the files of the override stylesheet or, without one, of the stylesheet stored with the plot.
+    """
+    if not os.path.exists(output_path):
+        return False
+
+    from sky.plotlib import get_stylesheet_files
+    style_files = get_stylesheet_files(stylesheet) if stylesheet is not None else get_stored_stylesheet_files(data_file)
+
+    source_time = os.path.getmtime(data_file)
+    for style_file in style_files:
+        # A removed stylesheet cannot be applied any more, the plot is rendered again to show the error
+        if not os.path.isfile(style_file):
+            return False
+        source_time = max(source_time, os.path.getmtime(style_file))
+    return os.path.getmtime(output_path) > source_time
+
+def init_worker():
+    'Imports matplotlib and the plot classes once per worker process'
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot
+    import sky.plotlib
+
+def render(data_file, output_path, stylesheet = None, dpi = None):
+    'Renders one pickled plot to output_path, stylesheet overrides the one stored with the plot'
+    import matplotlib as mpl
+    import matplotlib.pyplot as plt
+    from sky.plotlib import Plotter, PNG_DPI
+
+    with open(data_file, 'rb') as file:
+        plt_data = pickle.load(file)
+
+    # Every plot starts from the default style, styles applied by earlier plots of the worker are reverted
+    with mpl.rc_context():
+        plotter = Plotter(stylesheet = stylesheet if stylesheet is not None else plt_data.stylesheet,
+                          save_plot_data = False, open_saved_plot = False)
+        fig, _ = plotter.plot(*plt_data.plots, filename = plt_data.filename, fig_size = plt_data.fig_size,
+                              custom_fig = plt_data.custom_fig, subplot_grid = plt_data.subplot_grid,
+                              insert = plt_data.insert, plt_show = False, sharex = getattr(plt_data, "sharex", False),
+                              sharey = getattr(plt_data, "sharey", False), layout = getattr(plt_data, "layout", "auto"))
+
+        os.makedirs(os.path.dirname(output_path), exist_ok = True)
+        # Write to a temporary file first, an interrupted run leaves no output that looks up to date
+        extension = os.path.splitext(output_path)[1][1:]
+        temp_path = output_path + ".tmp"
+        fig.savefig(temp_path, format = extension, dpi = (dpi or PNG_DPI) if extension == "png" else dpi)
+        os.replace(temp_path, output_path)
+        plt.close(fig)
+
+def render_task(task):
+    data_file, output_path, stylesheet, dpi = task
+    try:
+        render(data_file, output_path, stylesheet, dpi)
+        return data_file, output_path, "rendered"
+    except Exception as error:
+        return data_file, output_path, f"failed: {type(error).__name__}: {error}"
+
+def regenerate(root, stylesheet = None, save_format = "pdf", output_dir = None, n_workers = None, force = False,
+               dpi = None, logger = None):
+    """ Re-renders all plots saved below root in a process pool
+
+    Returns a list of (data file, output file, status) with status "rendered", "skipped" (output newer
+    than data and stylesheet) or "failed: <error>". n_workers = 1 renders in this process.
+    """
+    if save_format not in FORMATS:
+        raise ValueError(f'Unknown format "{save_format}", use one of {FORMATS}')
+
+    results = []
+    tasks = []
+    for data_file in find_plot_data(root):
+        output_path = get_output_path(data_file, save_format, output_dir)
+        if not force and is_up_to_date(data_file, output_path, stylesheet):
+            results.append((data_file, output_path, "skipped"))
+        else:
+            tasks.append((data_file, output_path, stylesheet, dpi))
+
+    if n_workers == 1 or len(tasks) <= 1:
+        init_worker()
+        rendered = [render_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(n_workers, initializer = init_worker) as pool:
+            chunksize = max(len(tasks) // (4 * (n_workers or os.cpu_count() or 1)), 1)
+            rendered = list(pool.map(render_task, tasks, chunksize = chunksize))
+
+    results.extend(rendered)
+    if logger is not None:
+        for data_file, output_path, status in rendered:
+            logger.info(f"Regenerate {data_file} -> {output_path}: {status}")
+    return results
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Re-render the plots saved below a results folder')
+    parser.add_argument('root', nargs = '?', default = "results", help = 'folder searched for _plt_data folders')
+    parser.add_argument('--style', default = None, help = 'stylesheet used instead of the stored one')
+    parser.add_argument('--format', default = "pdf", choices = FORMATS, help = 'output format')
+    parser.add_argument('--output', default = None, help = 'folder for all outputs (default: <run>/regenerated_plots)')
+    parser.add_argument('--dpi', default = None, type = float, help = 'resolution of png files')
+    parser.add_argument('-j', '--jobs', default = None, type = int, help = 'number of worker processes')
+    parser.add_argument('--force', action = 'store_true', help = 'also render plots that are up to date')
+    args = parser.parse_args(argv)
+
+    results = regenerate(args.root, stylesheet = args.style, save_format = args.format, output_dir = args.output,
+                         n_workers = args.jobs, force = args.force, dpi = args.dpi)
+
+    failed = [result for result in results if result[2].startswith("failed")]
+    for data_file, _, status in failed:
+        print(f"{data_file}: {status}")
+    n_rendered = sum(result[2] == "rendered" for result in results)
+    n_skipped = sum(result[2] == "skipped" for result in results)
+    print(f"{n_rendered} rendered, {n_skipped} up to date, {len(failed)} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+import os
+import json
+import sqlite3
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+
+# The index lives in its own folder, so its journal files do not change the results folder itself
+INDEX_FOLDER = "_index"
+INDEX_NAME = "runs.sqlite"
+# Stored as PRAGMA user_version, the schema is only created when the file is older
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    folder TEXT UNIQUE NOT NULL,
+    tag TEXT,
+    created TEXT,
+    git_hash TEXT,
+    script_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_tag ON runs (tag);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created);
+CREATE TABLE IF NOT EXISTS params (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT,
+    num REAL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS params_name ON params (name, num);
+CREATE TABLE IF NOT EXISTS plots (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    PRIMARY KEY (run_id, filename)
+);
+"""
+
+class RunIndex:
+    """ SQLite index of all runs below a results folder
+
+    Runs are stored with their folder relative to the results folder (e.g. "2024-01-31/12_00_00_tag"),
+    together with tag, creation time, git hash, script hash, config values and the produced plots.
+    """
+    def __init__(self, root = "results"):
+        self.root = os.path.abspath(root)
+        self.path = os.path.join(self.root, INDEX_FOLDER, INDEX_NAME)
+
+    @contextmanager
+    def connect(self):
+        'Connection as context manager, commits on success and is always closed'
+        os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        connection = sqlite3.connect(self.path, timeout = 30)
+        connection.row_factory = sqlite3.Row
+        try:
+            # Off by default in SQLite and per connection, needed for ON DELETE CASCADE
+            connection.execute("PRAGMA foreign_keys = ON")
+            if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                connection.executescript(SCHEMA)
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def run_key(self, folder):
+        return os.path.relpath(os.path.abspath(folder), self.root).replace(os.sep, "/")
+
+    def add_run(self, folder, tag = "", created = None):
+        if created is None:
+            created = datetime.now().isoformat(timespec = "seconds")
+        with self.connect() as connection:
+            connection.execute("INSERT OR IGNORE INTO runs (folder, tag, created) VALUES (?, ?, ?)",
+                               (self.run_key(folder), tag, created))
+
+    def get_run_id(self, connection, folder):
+        key = self.run_key(folder)
+        connection.execute("INSERT OR IGNORE INTO runs (folder) VALUES (?)", (key,))
+        return connection.execute("SELECT id FROM runs WHERE folder = ?", (key,)).fetchone()["id"]
+
+    def update_run(self, folder, git_hash = None, script_hash = None):
+        with self.connect() as connection:
+            run_id = self.get_run_id(connection, folder)
+            if git_hash is not None:
+                connection.execute("UPDATE runs SET git_hash = ? WHERE id = ?", (git_hash, run_id))
+            if script_hash is not None:
+                connection.execute("UPDATE runs SET script_hash = ? WHERE id = ?", (script_hash, run_id))
+
+    def add_params(self, folder, params):
+        with self.connect() as connection:
+            run_id = self.get_run_id(connection, folder)
+            rows = [(run_id, name, json.dumps(value, default = str), to_number(value)) for name, value in params.items()]
+            connection.executemany("INSERT OR REPLACE INTO params (run_id, name, value, num) VALUES (?, ?, ?, ?)", rows)
+
+    def add_plot(self, folder, filename):
+        with self.connect() as connection:
+            run_id = self.get_run_id(connection, folder)
+            connection.execute("INSERT OR IGNORE INTO plots (run_id, filename) VALUES (?, ?)", (run_id, filename))
+
+    def remove_runs(self, folders):
+        'Removes the runs in the folders (run folders or date folders containing runs) with their params and plots'
+        with self.connect() as connection:
+            for folder in folders:
+                key = self.run_key(folder)
+                connection.execute("DELETE FROM runs WHERE folder = ? OR substr(folder, 1, ?) = ?",
+                                   (key, len(key) + 1, key + "/"))
+
+    def query(self, tag = None, start = None, end = None, params = None):
+        """ Returns the runs matching all given conditions, newest first
+
+            tag = "sin_wave"                        --> exact tag (case sensitive), * as wildcard
+            start = "2024-01-01", end = "2024-02-01" --> creation time range, end is exclusive
+            params = {"amp": 2, "freq": (0.1, 1)}   --> config value or inclusive (min, max) range
+        """
+        conditions = []
+        values = []
+
+        if tag is not None:
+            if "*" in tag:
+                # GLOB is case sensitive like the exact match, only * is a wildcard: ? and [ are escaped
+                conditions.append("runs.tag GLOB ?")
+                values.append(tag.replace("[", "[[]").replace("?", "[?]"))
+            else:
+                conditions.append("runs.tag = ?")
+                values.append(tag)
+        if start is not None:
+            conditions.append("runs.created >= ?")
+            values.append(str(start))
+        if end is not None:
+            conditions.append("runs.created < ?")
+            values.append(str(end))
+
+        for name, value in (params or {}).items():
+            if isinstance(value, tuple):
+                conditions.append("EXISTS (SELECT 1 FROM params WHERE params.run_id = runs.id AND params.name = ? "
+                                  "AND params.num BETWEEN ? AND ?)")
+                values.extend([name, value[0], value[1]])
+            elif to_number(value) is not None:
+                conditions.append("EXISTS (SELECT 1 FROM params WHERE params.run_id = runs.id AND params.name = ? "
+                                  "AND params.num = ?)")
+                values.extend([name, to_number(value)])
+            else:
+                conditions.append("EXISTS (SELECT 1 FROM params WHERE params.run_id = runs.id AND params.name = ? "
+                                  "AND params.value = ?)")
+                values.extend([name, json.dumps(value)])
+
+        sql = "SELECT * FROM runs"
+        if conditions:
+            sql = sql + " WHERE " + " AND ".join(conditions)
+        sql = sql + " ORDER BY runs.created DESC"
+
+        with self.connect() as connection:
+            runs = [dict(row) for row in connection.execute(sql, values)]
+            for run in runs:
+                run["params"] = {row["name"]: json.loads(row["value"]) for row in
+                                 connection.execute("SELECT name, value FROM params WHERE run_id = ?", (run["id"],))}
+                run["plots"] = [row["filename"] for row in
+                                connection.execute("SELECT filename FROM plots WHERE run_id = ?", (run["id"],))]
+        return runs
+
+def to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def find_index(path, max_depth = 6):
+    'RunIndex of the results folder containing path (or path itself), None if there is no index'
+    root = os.path.abspath(path)
+    for _ in range(max_depth):
+        if os.path.exists(os.path.join(root, INDEX_FOLDER, INDEX_NAME)):
+            return RunIndex(root)
+        root = os.path.dirname(root)
+    return None
+
+def remove_from_index(folders):
+    'Removes the runs in the folders from the index above them (called when old result folders are deleted)'
+    folders = list(folders)
+    if not folders:
+        return
+    try:
+        index = find_index(os.path.dirname(os.path.abspath(folders[0])))
+        if index is not None:
+            index.remove_runs(folders)
+    except sqlite3.Error as error:
+        print(f'Could not remove runs from index: {error}')
+
+def locate_run(path, max_depth = 6):
+    """ Finds the run index above path, returns (index, run folder, path relative to the run folder)
+
+    The run folder is the folder below the date folder: <results>/<date>/<run> or <results>/Archive/<date>/<run>.
+    Returns (None, None, None) if there is no index.
+    """
+    path = os.path.abspath(path)
+    root = path
+    for _ in range(max_depth):
+        if os.path.exists(os.path.join(root, INDEX_FOLDER, INDEX_NAME)):
+            break
+        root = os.path.dirname(root)
+    else:
+        return None, None, None
+
+    parts = os.path.relpath(path, root).split(os.sep)
+    n_run_parts = 3 if parts[0] == "Archive" else 2
+    if len(parts) < n_run_parts:
+        return None, None, None
+
+    index = RunIndex(root)
+    run_folder = os.path.join(root, *parts[0:n_run_parts])
+    return index, run_folder, "/".join(parts[n_run_parts:])
+
+def record_run(path, **fields):
+    """ Records git_hash/script_hash, params or a plot for the run containing path, if it is indexed """
+    try:
+        index, run_folder, rel_path = locate_run(path)
+        # Runs pruned in the meantime are not added to the index again
+        if index is None or not os.path.isdir(run_folder):
+            return None
+
+        params = fields.pop("params", None)
+        plot = fields.pop("plot", None)
+        if fields:
+            index.update_run(run_folder, **fields)
+        if params is not None:
+            index.add_params(run_folder, params)
+        if plot is not None:
+            index.add_plot(run_folder, "/".join(p for p in [rel_path, plot] if p))
+        return index
+    except sqlite3.Error as error:
+        print(f'Could not record run in index: {error}')
+        return None
+
+def parse_param(text):
+    'name=value or name=min:max, a value with ":" that is not a numeric range (e.g. a time) is matched exactly'
+    if "=" not in text:
+        raise ValueError(f'Invalid parameter "{text}", use name=value or name=min:max')
+    name, value = text.split("=", 1)
+    if ":" in value:
+        lower, upper = (to_number(bound) for bound in value.split(":", 1))
+        if lower is not None and upper is not None:
+            return name, (lower, upper)
+    return name, value
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Look up runs in the results index")
+    parser.add_argument('--results', default = "results", help = 'results folder containing the run index')
+    parser.add_argument('--tag', default = None, help = 'tag of the run, * as wildcard')
+    parser.add_argument('--since', default = None, help = 'start date, e.g. 2024-01-31')
+    parser.add_argument('--until', default = None, help = 'end date (exclusive)')
+    parser.add_argument('--param', action = 'append', default = [], help = 'name=value or name=min:max')
+    parser.add_argument('--json', action = 'store_true', help = 'print the runs as json')
+    args = parser.parse_args(argv)
+
+    index = RunIndex(args.results)
+    if not os.path.exists(index.path):
+        parser.error(f'No run index found at "{index.path}"')
+
+    try:
+        params = dict(parse_param(text) for text in args.param)
+    except ValueError as error:
+        parser.error(str(error))
+    runs = index.query(tag = args.tag, start = args.since, end = args.until, params = params)
+
+    if args.json:
+        print(json.dumps(runs, indent = 1))
+    else:
+        for run in runs:
+            params_text = ", ".join(f"{name} = {value}" for name, value in run["params"].items())
+            print(f'{run["created"]}  {run["folder"]}  git: {(run["git_hash"] or "-")[0:8]}  {params_text}')
+
+    return runs
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import os
+import json
+import hashlib
+import time
+import inspect
+import logging
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from sky.datastructures import Grid, GridData
+from sky.demo_model.logger import LOGGER_NAME, get_log_queue, init_worker_logger, set_log_context
+
+def config_to_dict(config):
+    if config is None:
+        return {}
+    if isinstance(config, dict):
+        return dict(config)
+    if hasattr(config, "to_dict"):
+        return config.to_dict()
+    return dict(vars(config))
+
+def create_model(model_class, config, logger = None):
+    'Creates the model, passing the config only to models that take one'
+    parameters = inspect.signature(model_class).parameters
+    kwargs = {}
+    if "config" in parameters:
+        kwargs["config"] = Namespace(**config)
+    if "logger" in parameters:
+        kwargs["logger"] = logger
+    return model_class(**kwargs)
+
+def evaluate_chunk(model_class, base_config, labels, para_nodes, domain_samples, chunk_idx = None):
+    """ Evaluates the model for every parameter node of the chunk
+
+    Returns the outputs of shape n_outputs x n_nodes_in_chunk
+    """
+    set_log_context(chunk = chunk_idx if chunk_idx is not None else "-")
+    logger = logging.getLogger(LOGGER_NAME)
+    t_start = time.perf_counter()
+    try:
+        values = evaluate_nodes(model_class, base_config, labels, para_nodes, domain_samples)
+    finally:
+        set_log_context(chunk = "-")
+    logger.info(f"Sweep: chunk {chunk_idx} evaluated {len(para_nodes)} nodes in {time.perf_counter() - t_start:.3f} s",
+                extra = {"chunk": chunk_idx, "n_nodes": len(para_nodes)})
+    return values
+
+def evaluate_nodes(model_class, base_config, labels, para_nodes, domain_samples):
+    # Models with a batch method evaluate the whole chunk in one call
+    if hasattr(model_class, "calculate_batch") and len(para_nodes) > 0:
+        # The first arguments take the domain samples (after self), the parameters have to match the remaining ones
+        batch_parameters = list(inspect.signature(model_class.calculate_batch).parameters)[1 + len(domain_samples):]
+        if all(label in batch_parameters for label in labels):
+            # The config of the model needs the swept parameters too, they are overridden by the batch arguments
+            config = dict(base_config)
+            config.update({label: value for label, value in zip(labels, para_nodes[0])})
+            model = create_model(model_class, config)
+            batch_kwargs = {label: para_nodes[:, idx] for idx, label in enumerate(labels)}
+            return model.calculate_batch(*domain_samples, returnType = "numpy", **batch_kwargs)
+
+    outputs = []
+    for node in para_nodes:
+        config = dict(base_config)
+        config.update({label: value for label, value in zip(labels, node)})
+        model = create_model(model_class, config)
+        outputs.append(np.asarray(model.calculate(*domain_samples, returnType = "numpy")).reshape(-1))
+    return np.stack(outputs, axis = 1)
+
+class SweepRunner:
+    """ Full factorial parameter sweep of a demo model over a process pool
+
+    Every node of para_grid (labels = config attribute names) is evaluated on the domain given by
+    domain_samples. The nodes are evaluated in chunks; with a save_path every finished chunk is written to
+    save_path/_sweep, so a killed sweep continues with the missing chunks when it is run again.
+    With init_logger(..., multiprocess = True) the workers log into the same file, every record carries
+    the worker and chunk id.
+
+        runner = SweepRunner(analytic_model_1d, Grid(amp, freq, labels = ["amp", "freq"]), x, config = config)
+        output = runner.run()
+        plots = create_scalar_para_plots(runner.para_grid, output, sample = [0, 1, 2])
+    """
+    def __init__(self, model_class, para_grid, *domain_samples, config = None, label = "f(x)", chunk_size = 16,
+                 n_workers = None, save_path = None, logger = None):
+        self.model_class = model_class
+        self.para_grid = para_grid
+        self.domain_samples = domain_samples
+        self.domain = Grid(*domain_samples)
+        self.base_config = config_to_dict(config)
+        self.label = label
+        self.chunk_size = chunk_size
+        self.n_workers = n_workers
+        self.logger = logger
+
+        self.chunks = [np.arange(start, min(start + chunk_size, para_grid.size))
+                       for start in range(0, para_grid.size, chunk_size)]
+
+        self.sweep_path = None
+        if save_path is not None:
+            self.sweep_path = os.path.join(save_path, "_sweep")
+
+    def fingerprint(self):
+        'Identifies the sweep, chunks on disk are only reused for the same model, parameters and domain'
+        sweep_hash = hashlib.sha256()
+        sweep_hash.update(f"{self.model_class.__module__}.{self.model_class.__qualname__}".encode())
+        sweep_hash.update(json.dumps(self.base_config, sort_keys = True, default = str).encode())
+        sweep_hash.update(json.dumps(list(self.para_grid.labels[0:self.para_grid.n_dim])).encode())
+        sweep_hash.update(np.ascontiguousarray(self.para_grid.nodes).tobytes())
+        for sample in self.domain_samples:
+            sweep_hash.update(np.ascontiguousarray(sample).tobytes())
+        sweep_hash.update(str(self.chunk_size).encode())
+        return sweep_hash.hexdigest()
+
+    def chunk_file(self, idx):
+        return os.path.join(self.sweep_path, f"chunk_{idx:05d}.npy")
+
+    def prepare_sweep_path(self):
+        os.makedirs(self.sweep_path, exist_ok = True)
+        info_file = os.path.join(self.sweep_path, "sweep.json")
+        fingerprint = self.fingerprint()
+
+        if os.path.exists(info_file):
+            with open(info_file, 'r') as file:
+                info = json.load(file)
+            if info["fingerprint"] != fingerprint:
+                raise ValueError(f'The folder "{self.sweep_path}" contains results of a different sweep')
+        else:
+            with open(info_file, 'w') as file:
+                json.dump({"fingerprint": fingerprint, "n_nodes": self.para_grid.size,
+                           "chunk_size": self.chunk_size, "labels": list(self.para_grid.labels)}, file)
+
+    def save_chunk(self, idx, chunk_values):
+        # Write under a temporary name first, a killed sweep never leaves half written chunks
+        tmp_file = self.chunk_file(idx) + ".tmp"
+        with open(tmp_file, 'wb') as file:
+            np.save(file, chunk_values)
+        os.replace(tmp_file, self.chunk_file(idx))
+
+    def run(self):
+        values = np.empty((self.domain.size, self.para_grid.size))
+        pending = []
+
+        if self.sweep_path is not None:
+            self.prepare_sweep_path()
+
+        for idx, chunk in enumerate(self.chunks):
+            if self.sweep_path is not None and os.path.exists(self.chunk_file(idx)):
+                values[:, chunk] = np.load(self.chunk_file(idx))
+            else:
+                pending.append(idx)
+
+        if self.logger is not None:
+            self.logger.info(f"Sweep: {len(self.chunks) - len(pending)} of {len(self.chunks)} chunks loaded, "
+                             f"{len(pending)} chunks to evaluate")
+
+        labels = self.para_grid.labels[0:self.para_grid.n_dim]
+
+        if self.n_workers == 1:
+            for idx in pending:
+                chunk_values = evaluate_chunk(self.model_class, self.base_config, labels,
+                                              self.para_grid.nodes[self.chunks[idx]], self.domain_samples, idx)
+                self.finish_chunk(idx, chunk_values, values)
+        else:
+            # Workers send their records to the listener of the parent if there is a multi-process logger
+            log_queue = get_log_queue()
+            pool_kwargs = {}
+            if log_queue is not None:
+                pool_kwargs = dict(initializer = init_worker_logger, initargs = (log_queue,))
+
+            with ProcessPoolExecutor(max_workers = self.n_workers, **pool_kwargs) as executor:
+                futures = {executor.submit(evaluate_chunk, self.model_class, self.base_config, labels,
+                                           self.para_grid.nodes[self.chunks[idx]], self.domain_samples, idx): idx
+                           for idx in pending}
+                for future in as_completed(futures):
+                    self.finish_chunk(futures[future], future.result(), values)
+
+        return GridData(self.domain, values, label = self.label)
+
+    def finish_chunk(self, idx, chunk_values, values):
+        values[:, self.chunks[idx]] = chunk_values
+        if self.sweep_path is not None:
+            self.save_chunk(idx, chunk_values)
+        if self.logger is not None:
+            self.logger.info(f"Sweep: chunk {idx} finished", extra = {"chunk": idx})
+
+def run_sweep(model_class, para_grid, *domain_samples, **kwargs):
+    'Shortcut for SweepRunner(...).run()'
+    return SweepRunner(model_class, para_grid, *domain_samples, **kwargs).run()
+
+def run_config_sweep(model_class, config, *domain_samples, **kwargs):
+    'Sweep over the list values of a FrozenConfig (e.g. freq: [0.5, 1, 2] in the YAML file), para_grid = config.grid()'
+    return run_sweep(model_class, config.grid(), *domain_samples, config = config.base(), **kwargs)